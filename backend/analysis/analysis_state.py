@@ -0,0 +1,214 @@
+# analysis/analysis_state.py
+
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+from dataclasses import fields
+import result_encoding
+from data.data_version import redis_client
+from . import model
+from .model import RegressionStats
+
+logger = logging.getLogger(__name__)
+
+# Funds are typically resubmitted monthly with one more month of returns. The rolling windows
+# of the previous analysis are kept per fund and factor set, so windows whose inputs have not
+# changed are not refitted. Factor sets with residualized factors are never kept: residualizing
+# over the whole history changes every factor row when a month is added. Off (0) by default.
+ANALYSIS_STATE_TTL_SECONDS = int(os.getenv('ANALYSIS_STATE_TTL_SECONDS', 0))
+ANALYSIS_STATE_PREFIX = 'analysis_state:'
+# Bump when the stored layout or the model outputs change
+ANALYSIS_STATE_VERSION = 1
+
+
+def state_enabled():
+    return ANALYSIS_STATE_TTL_SECONDS > 0
+
+
+def state_key(data):
+    """
+    Key of the stored analysis state for this request's fund, benchmark and factor set.
+
+    The fund's returns are not part of the key: a resubmission with more months maps to the
+    same state, and load_state works out which windows are still valid. The solver settings
+    are part of it, since they affect every window.
+
+    Returns None, so no state is loaded or stored, when any factor is residualized.
+    """
+    if any(stream['residualization'] for stream in data['residual_return_streams']):
+        return None
+    identity = {
+        'version': ANALYSIS_STATE_VERSION,
+        'fund': data['fund']['description'],
+        'benchmark': [data['benchmark']['source'], data['benchmark']['description']],
+        'factors': [
+            [stream['description'], stream['source'], sorted(stream['residualization'])]
+            for stream in data['residual_return_streams']
+        ],
+        'solver': [
+            model.LASSO_SOLVER, model.RIDGE_ALPHAS.tolist(), model.LASSO_ALPHAS.tolist(), model.CV_SPLITS
+        ]
+    }
+    canonical = json.dumps(identity, sort_keys=True, separators=(',', ':'))
+    return ANALYSIS_STATE_PREFIX + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def input_arrays(return_df, regression_df):
+    """Window end dates, returns and factors of one return type, as stored in the state."""
+    return (
+        return_df.index.strftime('%Y-%m-%d').to_numpy(dtype=str),
+        return_df.iloc[:, 0].to_numpy(dtype=float),
+        regression_df.to_numpy(dtype=float)
+    )
+
+
+def unchanged_rows(previous, current):
+    """
+    Number of leading rows, counting from the first month, on which two histories agree exactly.
+
+    Parameters:
+    - previous, current (tuple): (dates, returns, factors) from input_arrays.
+    """
+    previous_dates, previous_returns, previous_factors = previous
+    dates, returns, factors = current
+    if previous_factors.shape[1:] != factors.shape[1:]:
+        return 0
+    n = min(len(previous_dates), len(dates))
+    same = previous_dates[:n] == dates[:n]
+    same &= _same_values(previous_returns[:n], returns[:n])
+    same &= _same_values(previous_factors[:n], factors[:n]).all(axis=1)
+    changed = np.flatnonzero(~same)
+    return int(changed[0]) if len(changed) else n
+
+
+def factors_revised(previous, current):
+    """
+    Whether the factors differ from the stored ones from the first month on, while the months
+    themselves agree: the factors depend on the whole history, so no stored window will
+    ever be reusable.
+    """
+    previous_dates, _, previous_factors = previous
+    dates, _, factors = current
+    if not len(previous_dates) or not len(dates) or previous_dates[0] != dates[0]:
+        return False
+    return previous_factors.shape[1:] != factors.shape[1:] or not _same_values(previous_factors[0], factors[0]).all()
+
+
+def _same_values(a, b):
+    return (a == b) | (np.isnan(a) & np.isnan(b))
+
+
+def load_state(key, inputs):
+    """
+    Model states to resume from for each return type, time frame and model.
+
+    Only windows that end before the first row whose dates, returns or factors differ from the
+    stored analysis are carried over. A Lasso warm start is only kept when every stored window
+    is, since it continues the solution path from the last stored window.
+
+    Parameters:
+    - key (str): From state_key.
+    - inputs (dict): input_arrays by model label.
+
+    Returns:
+    - states (dict): {model_label: {time_frame: {model_type: state}}} for run_regression; empty
+      when nothing can be reused.
+    - keep (bool): Whether the analysis is worth storing for the next run; False when the
+      stored factors were revised from the first month on (see factors_revised).
+    """
+    if key is None or not state_enabled():
+        return {}, False
+    try:
+        payload = redis_client().get(key)
+    except Exception as e:
+        logger.warning(f"Analysis state lookup failed: {e}")
+        return {}, True
+    if payload is None:
+        return {}, True
+
+    stored = result_encoding.decode_json(payload)
+    states = {}
+    revised = False
+    for model_label, current in inputs.items():
+        if model_label not in stored['inputs']:
+            continue
+        previous = stored['inputs'][model_label]
+        previous = (
+            np.array(previous['dates'], dtype=str),
+            np.array(previous['returns'], dtype=float),
+            np.array(previous['factors'], dtype=float).reshape(len(previous['dates']), -1)
+        )
+        revised = revised or factors_revised(previous, current)
+        rows = unchanged_rows(previous, current)
+        for time_frame, models in stored['models'][model_label].items():
+            # Window i covers rows i .. i + time_frame - 1
+            reusable = max(rows - int(time_frame) + 1, 0)
+            for model_type, saved in models.items():
+                window_stats = stats_from_columns(saved['window_stats'])[:reusable]
+                if not window_stats:
+                    continue
+                state = {'window_stats': window_stats}
+                if saved.get('warm_start') is not None and len(window_stats) == len(saved['window_stats']['coefficients']):
+                    state['warm_start'] = saved['warm_start']
+                states.setdefault(model_label, {}).setdefault(int(time_frame), {})[model_type] = state
+
+    reused = sum(len(state['window_stats']) for frames in states.values() for models in frames.values() for state in models.values())
+    logger.info(f"Resuming {reused} rolling windows from the stored analysis state")
+    if revised:
+        # Storing this analysis would not help the next run either; let the stored one go
+        logger.info("Stored factors were revised from the first month; not keeping the analysis state")
+        try:
+            redis_client().delete(key)
+        except Exception as e:
+            logger.warning(f"Analysis state delete failed: {e}")
+    return states, not revised
+
+
+def save_state(key, inputs, states):
+    """
+    Store the inputs and every window's statistics of a completed analysis.
+
+    Parameters:
+    - key (str): From state_key.
+    - inputs (dict): input_arrays by model label.
+    - states (dict): {model_label: {time_frame: {model_type: state}}} as updated by run_regression.
+    """
+    if key is None or not state_enabled():
+        return
+    stored = {
+        'inputs': {
+            model_label: {'dates': dates.tolist(), 'returns': returns, 'factors': factors}
+            for model_label, (dates, returns, factors) in inputs.items()
+        },
+        'models': {
+            model_label: {
+                time_frame: {
+                    model_type: {
+                        'window_stats': model.format_regression_stats([], state['window_stats'], 'columnar'),
+                        'warm_start': state.get('warm_start')
+                    }
+                    for model_type, state in models.items()
+                }
+                for time_frame, models in frames.items()
+            }
+            for model_label, frames in states.items()
+        }
+    }
+    try:
+        redis_client().set(key, result_encoding.encode_json(stored), ex=ANALYSIS_STATE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Analysis state store failed: {e}")
+
+
+def stats_from_columns(columns):
+    """Inverse of format_regression_stats(..., 'columnar')."""
+    n_windows = len(columns['coefficients'])
+    return [
+        RegressionStats(**{
+            field.name: None if columns[field.name] is None else columns[field.name][i]
+            for field in fields(RegressionStats)
+        })
+        for i in range(n_windows)
+    ]
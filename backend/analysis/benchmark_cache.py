@@ -0,0 +1,69 @@
+# analysis/benchmark_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class BenchmarkCache:
+    """
+    In-process cache of benchmark return series, keyed by benchmark name.
+
+    Entries are evicted least-recently-used first once the cached series exceed `max_bytes`,
+    expire after `ttl_seconds`, and are all dropped when the benchmark data version changes.
+    A `max_bytes` of 0 disables the cache.
+    """
+
+    def __init__(self, max_bytes, ttl_seconds):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.data_version = None
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def validate(self, data_version):
+        """Drop every entry if the benchmark data version has moved on since they were loaded."""
+        if data_version is None:
+            return
+        with self._lock:
+            if data_version != self.data_version:
+                self._entries.clear()
+                self.current_bytes = 0
+                self.data_version = data_version
+
+    def get_many(self, benchmark_names):
+        """Return the cached, unexpired series for whichever of the names are present."""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for name in benchmark_names:
+                entry = self._entries.get(name)
+                if entry is not None and now - entry[1] > self.ttl_seconds:
+                    self._remove(name)
+                    entry = None
+                if entry is None:
+                    continue
+                self._entries.move_to_end(name)
+                found[name] = entry[0]
+        return found
+
+    def put(self, benchmark_name, series):
+        nbytes = int(series.memory_usage(index=True, deep=True))
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if benchmark_name in self._entries:
+                self._remove(benchmark_name)
+            self._entries[benchmark_name] = (series, time.monotonic(), nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, benchmark_name):
+        _, _, nbytes = self._entries.pop(benchmark_name)
+        self.current_bytes -= nbytes
@@ -1,91 +1,130 @@
+import os
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression
-
-
-def create_cone_chart(return_series):
-    monthly_excess_return = prepend_zero_to_series(return_series)
-    cumulative_excess_return = (1 + monthly_excess_return).cumprod() - 1
-
-    # Fit line of best fit without intercept
-    x = np.arange(len(cumulative_excess_return)).reshape(-1, 1)
-    y = cumulative_excess_return.values.reshape(-1, 1)
-    model = LinearRegression(fit_intercept=False).fit(x, y)
-    best_fit_line = model.predict(x).flatten()
-    best_fit_line[0] = 0  # Ensuring starts at 0
-    annualized_best_fit_return = (1 + model.coef_[0][0]) ** 12 - 1
-
-    # Calculate annualized alpha off of actual cumulative returns
-    annualized_alpha = np.power(1 + cumulative_excess_return.iloc[-1], 12 / len(cumulative_excess_return)) - 1
-
-    # Calculate tracking error from monthly excess returns
-    monthly_diffs = monthly_excess_return - model.coef_[0][0]
-    std_dev_excess_return = np.std(monthly_diffs)
-    tracking_error_annualized = std_dev_excess_return * np.sqrt(12)
-
-    # Calculate standard deviation bands from the line of best fit
-    std_deviations = std_dev_excess_return * np.sqrt(np.arange(len(best_fit_line)))
-    bands = {
-        '-2 STD': best_fit_line - 2 * std_deviations,
-        '-1 STD': best_fit_line - 1 * std_deviations,
-        '+1 STD': best_fit_line + 1 * std_deviations,
-        '+2 STD': best_fit_line + 2 * std_deviations,
+from .downsampling import downsample_chart
+
+# Standard deviation multiples drawn either side of the line of best fit, e.g. "1,2" or "1,1.5,2"
+CONE_BAND_MULTIPLES = [float(multiple) for multiple in os.getenv('CONE_BAND_MULTIPLES', '1,2').split(',')]
+# Return periods per year, for annualizing the title figures
+CONE_PERIODS_PER_YEAR = int(os.getenv('CONE_PERIODS_PER_YEAR', 12))
+
+# Band colours from the innermost band outwards; further bands reuse the last one
+BAND_COLORS = ['lightblue', 'blue', 'navy']
+
+
+def create_cone_chart(return_series, max_points=None, band_multiples=None, periods_per_year=None):
+    """Cone chart of one return series; see create_cone_charts."""
+    charts = create_cone_charts(return_series.to_frame(), max_points, band_multiples, periods_per_year)
+    return next(iter(charts.values()))
+
+
+def create_cone_charts(return_df, max_points=None, band_multiples=None, periods_per_year=None):
+    """
+    Cone charts of several return series over the same periods, computed together.
+
+    Each chart plots the cumulative return from a zero starting point, its least-squares line
+    through the origin and bands of +/- multiples of the tracking error, widening with the
+    square root of time.
+
+    Parameters:
+    - return_df (pd.DataFrame): Periodic returns, one column per series.
+    - max_points (int): Maximum number of points per chart series, or None for every point.
+    - band_multiples (list[float]): Standard deviation multiples of the bands. Defaults to CONE_BAND_MULTIPLES.
+    - periods_per_year (int): Return periods per year. Defaults to CONE_PERIODS_PER_YEAR.
+
+    Returns:
+    - charts (dict): Chart data for react-chartjs-2 by column.
+    """
+    band_multiples = sorted(band_multiples or CONE_BAND_MULTIPLES)
+    periods_per_year = periods_per_year or CONE_PERIODS_PER_YEAR
+    stats = cone_statistics(return_df.to_numpy(dtype=float).T, periods_per_year)
+
+    dates = [start_label(return_df.index.min())] + return_df.index.strftime('%Y-%m-%d').tolist()
+    root_time = np.sqrt(np.arange(len(dates)))
+
+    charts = {}
+    for i, column in enumerate(return_df.columns):
+        title = (
+            f"Annualized Return: {stats['annualized_return'][i]*100:.2f}%, "
+            f"Line of Best Fit: {stats['annualized_best_fit'][i]*100:.2f}%, "
+            f"Tracking Error: {stats['tracking_error'][i]*100:.2f}%\n(Logarithic Values)"
+        )
+        best_fit_line = stats['best_fit'][i]
+        std_deviations = stats['std'][i] * root_time
+        lower = [band_dataset(-multiple, best_fit_line - multiple * std_deviations, rank) for rank, multiple in enumerate(band_multiples)]
+        upper = [band_dataset(multiple, best_fit_line + multiple * std_deviations, rank) for rank, multiple in enumerate(band_multiples)]
+
+        # The series stay NumPy arrays until the result is encoded
+        chart = {
+            "title": title,
+            "labels": dates,
+            "datasets": [
+                {
+                    "label": "Actual Cumulative Alpha",
+                    "data": stats['cumulative'][i],
+                    "borderColor": "red",
+                    "fill": False
+                },
+                {
+                    "label": "Best Fit Line",
+                    "data": best_fit_line,
+                    "borderColor": "green",
+                    "fill": False
+                },
+                *lower[::-1],
+                *upper
+            ]
+        }
+
+        # Optionally thin the chart to max_points; the title figures use every period
+        charts[column] = downsample_chart(chart, max_points, reference="Actual Cumulative Alpha")
+    return charts
+
+
+def cone_statistics(returns, periods_per_year=12):
+    """
+    Closed-form cone statistics of many return series at once.
+
+    Parameters:
+    - returns (np.ndarray): Periodic returns of shape (n_series, n_periods).
+    - periods_per_year (int): Return periods per year.
+
+    Returns:
+    - stats (dict): 'cumulative' and 'best_fit' of shape (n_series, n_periods + 1), starting
+      from zero, and per-series 'slope', 'std' (per period), 'annualized_return',
+      'annualized_best_fit' and 'tracking_error'.
+    """
+    n_series, n_periods = returns.shape
+    padded = np.zeros((n_series, n_periods + 1))
+    padded[:, 1:] = returns
+    cumulative = np.cumprod(1 + padded, axis=1) - 1
+
+    # Slope of the least-squares line through the origin: sum(t * y) / sum(t^2)
+    t = np.arange(n_periods + 1, dtype=float)
+    slope = cumulative @ t / (t @ t) if n_periods else np.zeros(n_series)
+    best_fit = slope[:, None] * t
+
+    std = np.std(padded - slope[:, None], axis=1)
+    return {
+        'cumulative': cumulative,
+        'best_fit': best_fit,
+        'slope': slope,
+        'std': std,
+        'annualized_return': np.power(1 + cumulative[:, -1], periods_per_year / (n_periods + 1)) - 1,
+        'annualized_best_fit': (1 + slope) ** periods_per_year - 1,
+        'tracking_error': std * np.sqrt(periods_per_year),
     }
 
-    dates = monthly_excess_return.index.strftime('%Y-%m-%d').tolist()
-    title = f"Annualized Return: {annualized_alpha*100:.2f}%, Line of Best Fit: {annualized_best_fit_return*100:.2f}%, Tracking Error: {tracking_error_annualized*100:.2f}%\n(Logarithic Values)"
-
-    # JSON data for react-chartjs-2
-    data = {
-        "title": title,
-        "labels": dates,
-        "datasets": [
-            {
-                "label": "Actual Cumulative Alpha",
-                "data": [float(cumulative_excess_return.iloc[idx]) for idx in range(len(dates))],
-                "borderColor": "red",
-                "fill": False
-            },
-            {
-                "label": "Best Fit Line",
-                "data": [float(best_fit_line[idx]) for idx in range(len(dates))],
-                "borderColor": "green",
-                "fill": False
-            },
-            {
-                "label": "-2 STD",
-                "data": [float(bands['-2 STD'][idx]) for idx in range(len(dates))],
-                "borderColor": "blue",
-                "fill": False
-            },
-            {
-                "label": "-1 STD",
-                "data": [float(bands['-1 STD'][idx]) for idx in range(len(dates))],
-                "borderColor": "lightblue",
-                "fill": False
-            },
-            {
-                "label": "+1 STD",
-                "data": [float(bands['+1 STD'][idx]) for idx in range(len(dates))],
-                "borderColor": "lightblue",
-                "fill": False
-            },
-            {
-                "label": "+2 STD",
-                "data": [float(bands['+2 STD'][idx]) for idx in range(len(dates))],
-                "borderColor": "blue",
-                "fill": False
-            }
-        ]
+
+def band_dataset(multiple, data, rank):
+    return {
+        "label": f"{multiple:+g} STD",
+        "data": data,
+        "borderColor": BAND_COLORS[min(rank, len(BAND_COLORS) - 1)],
+        "fill": False
     }
 
-    return data
 
-def prepend_zero_to_series(series):
-    earliest_date = series.index.min()
-    # Calculate the previous month
-    previous_month_date = (earliest_date - pd.DateOffset(months=1)).replace(day=1) + pd.DateOffset(days=-1)
-    # Create a new series with the zero value and the previous month date
-    new_series = pd.Series([0], index=[previous_month_date])
-    # Concatenate the new series with the original series
-    return pd.concat([new_series, series])
\ No newline at end of file
+def start_label(first_date):
+    # Date of the zero starting point, ahead of the first return
+    return ((first_date - pd.DateOffset(months=1)).replace(day=1) + pd.DateOffset(days=-1)).strftime('%Y-%m-%d')
@@ -2,8 +2,15 @@ import pandas as pd
 import json
 import statsmodels.api as sm
 import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text, bindparam, Date
+from .benchmark_cache import BenchmarkCache
+from . import instrumentation
+from data.data_version import get_benchmark_data_version
+from data.benchmark_snapshot import load_snapshot
+from data.shared_panel import get_shared_panel
 
 
 load_dotenv()
@@ -13,18 +20,89 @@ if uri and uri.startswith("postgres://"):
     uri = uri.replace("postgres://", "postgresql://")
 engine = create_engine(uri)
 
+# Per-process benchmark cache; BENCHMARK_CACHE_MAX_BYTES=0 disables it
+benchmark_cache = BenchmarkCache(
+    max_bytes=int(os.getenv('BENCHMARK_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    ttl_seconds=float(os.getenv('BENCHMARK_CACHE_TTL_SECONDS', 24 * 60 * 60))
+)
+
 
 def create_return_dfs(data):
     fund_description = data['fund']['description']
     benchmark_description = data['benchmark']['description']
     fund_return_df = prepare_fund_return_df(data['fund'], fund_description)
-    benchmark_return_df = fetch_benchmark_return_df(data['benchmark']['source'], benchmark_description)
+    benchmark_names = required_benchmark_names(data)
+    with instrumentation.span('fetch_benchmarks', benchmarks=len(benchmark_names)) as fetch_span:
+        benchmark_panel = fetch_benchmark_returns(
+            benchmark_names,
+            start_date=fund_return_df.index.min().replace(day=1),
+            end_date=fund_return_df.index.max()
+        )
+        fetch_span['rows'] = len(benchmark_panel)
+    benchmark_return_df = benchmark_panel[[data['benchmark']['source']]].rename(
+        columns={data['benchmark']['source']: benchmark_description}
+    )
     active_return_df = calculate_active_returns(fund_return_df, benchmark_return_df, fund_description, benchmark_description)
-    regression_df, remaining_funds = create_initial_regression_df(fund_return_df, data['residual_return_streams'])
-    regression_df = process_remaining_funds(regression_df, remaining_funds)
+    plan = plan_residualization(data['residual_return_streams'])
+    with instrumentation.span('residualization', rows=len(fund_return_df), factors=len(plan.columns)):
+        regression_df = create_initial_regression_df(fund_return_df, plan, benchmark_panel)
+        regression_df = perform_residualization(regression_df, plan, benchmark_panel)
     return fund_return_df, benchmark_return_df, active_return_df, regression_df
 
 
+def create_batch_return_dfs(data):
+    """
+    Return DataFrames for a lineup of funds analyzed against one benchmark and factor set.
+
+    Benchmarks are fetched once for the whole lineup. Funds reporting the same months are
+    grouped and share one regression_df, residualized over those months as create_return_dfs
+    would for each of them.
+
+    Parameters:
+    - data (dict): As for create_return_dfs, with a list of 'funds' in place of 'fund'.
+
+    Returns:
+    - groups (list[tuple]): (fund_return_df, active_return_df, regression_df) per group of funds,
+      the return DataFrames having one column per fund, named after its description.
+    """
+    benchmark_source = data['benchmark']['source']
+    fund_return_dfs = []
+    for fund in data['funds']:
+        if any(fund['description'] in df.columns for df in fund_return_dfs):
+            raise Exception(f"Duplicate fund: {fund['description']}")
+        fund_return_dfs.append(prepare_fund_return_df(fund, fund['description']))
+
+    benchmark_names = required_benchmark_names(data)
+    with instrumentation.span('fetch_benchmarks', benchmarks=len(benchmark_names)) as fetch_span:
+        benchmark_panel = fetch_benchmark_returns(
+            benchmark_names,
+            start_date=min(df.index.min() for df in fund_return_dfs).replace(day=1),
+            end_date=max(df.index.max() for df in fund_return_dfs)
+        )
+        fetch_span['rows'] = len(benchmark_panel)
+    plan = plan_residualization(data['residual_return_streams'])
+
+    funds_by_months = {}
+    for df in fund_return_dfs:
+        funds_by_months.setdefault(tuple(df.index), []).append(df)
+
+    groups = []
+    for frames in funds_by_months.values():
+        fund_return_df = pd.concat(frames, axis=1)
+        active_return_df = fund_return_df.sub(benchmark_panel[benchmark_source].reindex(fund_return_df.index), axis=0)
+        with instrumentation.span('residualization', rows=len(fund_return_df), factors=len(plan.columns)):
+            regression_df = create_initial_regression_df(fund_return_df, plan, benchmark_panel)
+            regression_df = perform_residualization(regression_df, plan, benchmark_panel)
+        groups.append((fund_return_df, active_return_df, regression_df))
+    return groups
+
+
+def required_benchmark_names(data):
+    names = [data['benchmark']['source']]
+    names += [regression_json['source'] for regression_json in data['residual_return_streams']]
+    return list(dict.fromkeys(names))
+
+
 def prepare_fund_return_df(fund_data, fund_description):
     df = pd.DataFrame(fund_data['pastedData'])
     df['return'] = pd.to_numeric(df['return'])
@@ -34,73 +112,134 @@ def prepare_fund_return_df(fund_data, fund_description):
     return df
 
 
-def fetch_benchmark_return_df(benchmark_source, benchmark_description):
+def fetch_benchmark_returns(benchmark_names, start_date=None, end_date=None):
+    benchmark_names = list(benchmark_names)
+
+    # Read from the host's shared panel, or else the local memory-mapped snapshot of the current
+    # data version, when it has every benchmark
+    panel = get_shared_panel(engine) or load_snapshot(get_benchmark_data_version())
+    if panel is not None and all(name in panel for name in benchmark_names):
+        return panel.frame(benchmark_names, start_date, end_date)
+
+    if not benchmark_cache.enabled:
+        return query_benchmark_returns(benchmark_names, start_date, end_date)
+
+    # Serve full histories from the cache and load only the misses, in one query
+    benchmark_cache.validate(get_benchmark_data_version())
+    series_by_name = benchmark_cache.get_many(benchmark_names)
+    missing = [name for name in benchmark_names if name not in series_by_name]
+    if missing:
+        fetched = query_benchmark_returns(missing)
+        for name in missing:
+            series_by_name[name] = fetched[name].dropna()
+            benchmark_cache.put(name, series_by_name[name])
+
+    panel = pd.concat([series_by_name[name].rename(name) for name in benchmark_names], axis=1).sort_index()
+    if start_date is not None:
+        panel = panel[panel.index >= pd.Timestamp(start_date)]
+    if end_date is not None:
+        panel = panel[panel.index <= pd.Timestamp(end_date)]
+    return panel
+
+
+def query_benchmark_returns(benchmark_names, start_date=None, end_date=None):
+    # One parameterized round trip for every benchmark, pivoted to one column per benchmark
+    query = "SELECT benchmark_name, date, return_rate FROM benchmark_returns WHERE benchmark_name IN :names"
+    params = {'names': list(benchmark_names)}
+    bind_params = [bindparam('names', expanding=True)]
+    if start_date is not None:
+        query += " AND date >= :start_date"
+        params['start_date'] = pd.Timestamp(start_date).date()
+        bind_params.append(bindparam('start_date', type_=Date))
+    if end_date is not None:
+        query += " AND date <= :end_date"
+        params['end_date'] = pd.Timestamp(end_date).date()
+        bind_params.append(bindparam('end_date', type_=Date))
+
     try:
-        df = pd.read_sql_query(
-            f"SELECT * FROM benchmark_returns WHERE benchmark_name='{benchmark_source}'", engine
-        )
-        df = df.rename(columns={'return_rate': benchmark_description}).drop(columns=['benchmark_name'])
+        df = pd.read_sql_query(text(query).bindparams(*bind_params), engine, params=params)
+        if df.empty:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name='date'), columns=list(benchmark_names), dtype=float)
         df['date'] = pd.to_datetime(df['date']) + pd.offsets.MonthEnd(0)
-        df.set_index('date', inplace=True)
-        return df
+        panel = df.pivot_table(index='date', columns='benchmark_name', values='return_rate', aggfunc='last')
+        panel = panel.reindex(columns=list(benchmark_names))
+        panel.columns.name = None
+        return panel
     except Exception as e:
         raise Exception(f"Error fetching benchmark returns: {e}")
 
 
+@dataclass
+class ResidualizationPlan:
+    levels: list   # Regression streams grouped so each level only depends on earlier ones; level 0 has no residualization
+    columns: list  # Factor descriptions in submission order
 
 
-
-def create_initial_regression_df(fund_return_df, residual_return_streams):
+def plan_residualization(residual_return_streams):
+    # Topologically sort the factors by their residualization dependencies (Kahn's algorithm)
+    streams = {}
+    for regression_json in residual_return_streams:
+        if regression_json['description'] in streams:
+            raise Exception(f"Duplicate regression factor: {regression_json['description']}")
+        streams[regression_json['description']] = regression_json
+
+    for description, regression_json in streams.items():
+        missing = [name for name in regression_json['residualization'] if name not in streams]
+        if missing:
+            raise Exception(f"Residualization of {description} depends on factors that were not provided: {missing}")
+
+    pending = {description: set(regression_json['residualization']) for description, regression_json in streams.items()}
+    levels = []
+    while pending:
+        ready = [description for description, dependencies in pending.items() if not dependencies]
+        if not ready:
+            raise Exception(f"Residualization dependencies form a cycle between: {sorted(pending)}")
+        levels.append([streams[description] for description in ready])
+        for description in ready:
+            del pending[description]
+        for dependencies in pending.values():
+            dependencies.difference_update(ready)
+
+    return ResidualizationPlan(levels=levels, columns=list(streams))
+
+
+def create_initial_regression_df(fund_return_df, plan, benchmark_panel):
     regression_df = pd.DataFrame(index=fund_return_df.index)
-    remaining_funds = []
+    if not plan.levels:
+        return regression_df
 
-    for regression_json in residual_return_streams:
-        if not regression_json['residualization']:
-            try:
-                df = fetch_benchmark_return_df(regression_json['source'], regression_json['description'])
-                regression_df = regression_df.merge(df, left_index=True, right_index=True, how='left')
-            except Exception as e:
-                raise Exception(f"Error fetching regression data: {e}")
-        elif set(regression_json['residualization']).issubset(set(regression_df.columns)):
-            regression_df = perform_residualization(regression_df, regression_json)
+    for regression_json in plan.levels[0]:
+        try:
+            regression_df[regression_json['description']] = benchmark_panel[regression_json['source']].reindex(regression_df.index)
+        except Exception as e:
+            raise Exception(f"Error fetching regression data: {e}")
+
+    return regression_df
+
+
+def perform_residualization(regression_df, plan, benchmark_panel):
+    # Factors within a level do not depend on each other, so each level is residualized concurrently
+    for level in plan.levels[1:]:
+        if len(level) == 1:
+            residuals = [residualize(regression_df, level[0], benchmark_panel)]
         else:
-            remaining_funds.append(regression_json)
+            with ThreadPoolExecutor(max_workers=len(level)) as executor:
+                residuals = list(executor.map(lambda regression_json: residualize(regression_df, regression_json, benchmark_panel), level))
+        for regression_json, resid in zip(level, residuals):
+            regression_df[regression_json['description']] = resid
 
-    return regression_df, remaining_funds
+    return regression_df[plan.columns]
 
 
-def perform_residualization(regression_df, regression_json):
+def residualize(regression_df, regression_json, benchmark_panel):
     try:
-        df = fetch_benchmark_return_df(regression_json['source'], 'return_rate')
-        df = df.reindex(regression_df.index)
-        y = df['return_rate']
+        y = benchmark_panel[regression_json['source']].reindex(regression_df.index).rename('return_rate')
         X = regression_df[regression_json['residualization']]
         X = sm.add_constant(X)
         model = sm.OLS(y, X).fit()
-        residuals = model.resid
-        regression_df[regression_json['description']] = residuals
+        return model.resid
     except Exception as e:
-        raise Exception(f"Error processing regression data: {e}")
-    return regression_df
-
-
-def process_remaining_funds(regression_df, remaining_funds):
-    j = 0
-    max_tries = len(remaining_funds) * 3
-
-    while remaining_funds:
-        i = j % len(remaining_funds)
-        if set(remaining_funds[i]['residualization']).issubset(set(regression_df.columns)):
-            try:
-                regression_df = perform_residualization(regression_df, remaining_funds[i])
-                del remaining_funds[i]
-            except Exception as e:
-                raise Exception(f"Error processing remaining regression data: {e}")
-        j += 1
-        if j > max_tries:
-            raise Exception(f"Residual returns could not be created for {remaining_funds}")
-
-    return regression_df
+        raise Exception(f"Error processing regression data for {regression_json['description']}: {e}")
 
 
 def calculate_active_returns(fund_return_df, benchmark_return_df, fund_description, benchmark_description):
@@ -0,0 +1,81 @@
+# analysis/downsampling.py
+
+import numpy as np
+
+
+def lttb_indices(values, max_points):
+    """
+    Pick at most `max_points` points of a series with Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The points in between are split into
+    max_points - 2 buckets, and each bucket keeps the point forming the largest triangle with
+    the previously kept point and the average of the next bucket, which preserves peaks,
+    troughs and the overall shape of the series. Points are assumed to be equally spaced.
+
+    Parameters:
+    - values (np.array): Series to downsample, shape (n,). Missing values count as 0.
+    - max_points (int): Maximum number of points to keep, at least 3.
+
+    Returns:
+    - indices (np.array): Sorted positions of the kept points.
+    """
+    max_points = int(max_points)
+    if max_points < 3:
+        raise ValueError(f"max_points must be at least 3, got {max_points}")
+
+    y = np.nan_to_num(np.asarray(values, dtype=float))
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    x = np.arange(n, dtype=float)
+    # Bucket b covers [edges[b], edges[b + 1]); the last point is a bucket of its own
+    edges = (np.floor(np.arange(max_points - 1) * (n - 2) / (max_points - 2)) + 1).astype(int)
+    edges[-1] = n - 1
+
+    indices = np.empty(max_points, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+    previous = 0
+    for b in range(max_points - 2):
+        start, end = edges[b], edges[b + 1]
+        next_end = edges[b + 2] if b + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+
+        # Twice the area of the triangle (previous, candidate, next bucket average)
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[b + 1] = previous
+    return indices
+
+
+def downsample_chart(chart, max_points, reference=None):
+    """
+    Thin a chart's labels and datasets to at most `max_points` shared points.
+
+    Points are chosen with LTTB on one dataset and the same points are kept in every dataset,
+    so the datasets stay aligned with the labels. Other chart fields are left as they are.
+
+    Parameters:
+    - chart (dict): Chart data with "labels" and "datasets".
+    - max_points (int): Maximum number of points; None or 0 returns the chart unchanged.
+    - reference (str): Label of the dataset that picks the points. Defaults to the first dataset.
+
+    Returns:
+    - chart (dict): The downsampled chart.
+    """
+    if not max_points or len(chart['labels']) <= max_points:
+        return chart
+
+    datasets = chart['datasets']
+    reference_data = next((dataset['data'] for dataset in datasets if dataset['label'] == reference), datasets[0]['data'])
+    keep = lttb_indices(reference_data, max_points)
+    return {
+        **chart,
+        'labels': [chart['labels'][i] for i in keep],
+        'datasets': [{**dataset, 'data': np.asarray(dataset['data'], dtype=float)[keep]} for dataset in datasets]
+    }
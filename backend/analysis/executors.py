@@ -0,0 +1,208 @@
+# analysis/executors.py
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Execution backend for the per-time-frame fan-out: 'thread', 'process' or 'serial'.
+# The 'process' backend needs a worker pool whose children may start processes
+# (`celery worker --pool=threads` or `--pool=solo`). Daemonic prefork pool processes may not,
+# so there it is rejected once, with an error, and threads are used instead.
+BACKENDS = ['thread', 'process', 'serial']
+ANALYSIS_EXECUTOR = os.getenv('ANALYSIS_EXECUTOR', 'thread')
+if ANALYSIS_EXECUTOR not in BACKENDS:
+    raise ValueError(f"ANALYSIS_EXECUTOR must be one of {BACKENDS}, got {ANALYSIS_EXECUTOR!r}")
+ANALYSIS_PROCESS_WORKERS = int(os.getenv('ANALYSIS_PROCESS_WORKERS', os.cpu_count() or 1))
+
+_process_pool = None
+_process_backend_rejected = False
+
+
+@dataclass(frozen=True)
+class SharedFrameHandle:
+    """Picklable reference to a float DataFrame stored in a shared memory block."""
+    name: str
+    n_rows: int
+    columns: list
+    index_name: str = None
+
+
+def share_frame(df):
+    """
+    Copy a DataFrame with a DatetimeIndex into a new shared memory block.
+
+    The block holds the index as int64 nanoseconds followed by the values as float64, row-major.
+
+    Returns:
+    - shm (SharedMemory): The block; the caller must close and unlink it.
+    - handle (SharedFrameHandle): Reference that can be sent to other processes.
+    """
+    n_rows, n_cols = df.shape
+    shm = shared_memory.SharedMemory(create=True, size=max(n_rows * (n_cols + 1) * 8, 1))
+    index, values = _frame_arrays(shm.buf, n_rows, n_cols)
+    index[:] = df.index.values.astype('datetime64[ns]').view(np.int64)
+    values[:] = df.to_numpy(dtype=float)
+    return shm, SharedFrameHandle(name=shm.name, n_rows=n_rows, columns=list(df.columns), index_name=df.index.name)
+
+
+def attach_frame(handle):
+    """
+    Open a shared frame read-only without copying its values.
+
+    Returns:
+    - shm (SharedMemory): The attached block; close it once the frame is no longer used.
+    - df (pd.DataFrame): Frame backed by the shared block.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=handle.name, track=False)
+    except TypeError:
+        # Python < 3.13 always tracks the block; pool processes share the creator's resource
+        # tracker, so the registration is released when the creator unlinks it
+        shm = shared_memory.SharedMemory(name=handle.name)
+    index, values = _frame_arrays(shm.buf, handle.n_rows, len(handle.columns))
+    index.flags.writeable = False
+    values.flags.writeable = False
+    df = pd.DataFrame(
+        values,
+        index=pd.DatetimeIndex(index.view('datetime64[ns]'), name=handle.index_name),
+        columns=handle.columns,
+        copy=False
+    )
+    return shm, df
+
+
+def _frame_arrays(buffer, n_rows, n_cols):
+    index = np.ndarray((n_rows,), dtype=np.int64, buffer=buffer)
+    values = np.ndarray((n_rows, n_cols), dtype=np.float64, buffer=buffer, offset=n_rows * 8)
+    return index, values
+
+
+def _call_with_shared_frames(func, args):
+    # Runs in a pool process: swap frame handles for shared-memory-backed DataFrames
+    attached = []
+    resolved = []
+    for arg in args:
+        if isinstance(arg, SharedFrameHandle):
+            shm, df = attach_frame(arg)
+            attached.append(shm)
+            resolved.append(df)
+        else:
+            resolved.append(arg)
+    try:
+        return func(*resolved)
+    finally:
+        for shm in attached:
+            shm.close()
+
+
+def get_process_pool():
+    """Persistent process pool shared by every task in this worker."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=ANALYSIS_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _process_pool
+
+
+def process_backend_allowed():
+    """
+    Whether this process may start the process pool. Reports a daemonic process, such as a
+    prefork pool child, the first time only.
+    """
+    global _process_backend_rejected
+    if not multiprocessing.current_process().daemon:
+        return True
+    if not _process_backend_rejected:
+        _process_backend_rejected = True
+        logger.error(
+            "ANALYSIS_EXECUTOR=process cannot start processes from a daemonic prefork pool process; "
+            "run the worker with --pool=threads or --pool=solo. Using threads."
+        )
+    return False
+
+
+def run_jobs(func, jobs, backend=None):
+    """
+    Run `func(*args)` for every job on the configured execution backend.
+
+    Parameters:
+    - func (callable): Module-level function, so it can be sent to pool processes.
+    - jobs (list): (key, args) pairs. DataFrame arguments are shipped to pool processes once
+      through shared memory, however many jobs use them.
+    - backend (str): 'thread', 'process' or 'serial'. Defaults to ANALYSIS_EXECUTOR.
+
+    Returns:
+    - outcomes (list): (key, result, exception) triples in completion order; exactly one of
+      result and exception is None.
+    """
+    backend = backend or ANALYSIS_EXECUTOR
+    if backend == 'process' and not process_backend_allowed():
+        backend = 'thread'
+
+    if backend == 'serial':
+        outcomes = []
+        for key, args in jobs:
+            try:
+                outcomes.append((key, func(*args), None))
+            except Exception as e:
+                outcomes.append((key, None, e))
+        return outcomes
+
+    if backend == 'process':
+        try:
+            return _run_jobs_in_processes(func, jobs)
+        except (BrokenProcessPool, OSError) as e:
+            # A pool process died or could not be started; the next task starts a new pool
+            global _process_pool
+            _process_pool = None
+            logger.warning(f"Process pool unavailable ({e}); falling back to threads")
+        return run_jobs(func, jobs, backend='thread')
+
+    if backend != 'thread':
+        raise ValueError(f"Unknown execution backend: {backend}")
+
+    with ThreadPoolExecutor() as executor:
+        futures = {executor.submit(func, *args): key for key, args in jobs}
+        return [_outcome(futures[future], future) for future in as_completed(futures)]
+
+
+def _run_jobs_in_processes(func, jobs):
+    shared = {}
+    try:
+        shipped_jobs = []
+        for key, args in jobs:
+            shipped_args = []
+            for arg in args:
+                if isinstance(arg, pd.DataFrame):
+                    if id(arg) not in shared:
+                        shared[id(arg)] = share_frame(arg)
+                    arg = shared[id(arg)][1]
+                shipped_args.append(arg)
+            shipped_jobs.append((key, shipped_args))
+
+        pool = get_process_pool()
+        futures = {pool.submit(_call_with_shared_frames, func, args): key for key, args in shipped_jobs}
+        return [_outcome(futures[future], future) for future in as_completed(futures)]
+    finally:
+        for shm, _ in shared.values():
+            shm.close()
+            shm.unlink()
+
+
+def _outcome(key, future):
+    exception = future.exception()
+    if isinstance(exception, BrokenProcessPool):
+        raise exception
+    return (key, None, exception) if exception is not None else (key, future.result(), None)
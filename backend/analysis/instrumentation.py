@@ -0,0 +1,139 @@
+# analysis/instrumentation.py
+
+import os
+import time
+import random
+import logging
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from celery.exceptions import Ignore
+import task_metrics
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # Optional: only needed to profile tasks (TASK_PROFILE_DIR)
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+# Sampling profiler: when TASK_PROFILE_DIR is set, tasks submitted with options.profile, plus a
+# TASK_PROFILE_RATE fraction of all tasks, write an HTML profile to <dir>/<task id>.html
+TASK_PROFILE_DIR = os.getenv('TASK_PROFILE_DIR') or None
+TASK_PROFILE_RATE = float(os.getenv('TASK_PROFILE_RATE', 0))
+TASK_PROFILE_INTERVAL = float(os.getenv('TASK_PROFILE_INTERVAL', 0.001))
+
+_spans = ContextVar('analysis_spans', default=None)
+
+
+@contextmanager
+def collect():
+    """
+    Collect the spans recorded by the code in this block, in this thread.
+
+    Yields the list the spans are appended to. Work handed to other threads or processes
+    collects its own spans and passes them back (see add_spans).
+    """
+    spans = []
+    token = _spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _spans.reset(token)
+
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Time one stage of a task.
+
+    Attributes such as rows, factors, model or window are stored with the span; the yielded
+    dict can be updated with ones only known once the stage has run. Outside collect() the
+    span is not recorded.
+    """
+    record = {'stage': stage, **attributes}
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        spans = _spans.get()
+        if spans is not None:
+            record['seconds'] = time.perf_counter() - start
+            spans.append(record)
+
+
+def add_spans(spans):
+    """Add spans collected elsewhere, e.g. by an executor job, to the current collection."""
+    current = _spans.get()
+    if current is not None:
+        current.extend(spans)
+
+
+@contextmanager
+def profiled(task_id, requested=False):
+    """
+    Run the block under pyinstrument's sampling profiler and save an HTML report.
+
+    Only the calling thread is sampled, so work on the thread or process executor shows as
+    waiting; run with ANALYSIS_EXECUTOR=serial to see inside it.
+
+    Parameters:
+    - task_id (str): Names the report file.
+    - requested (bool): Whether the request asked to be profiled.
+
+    Yields the report path, or None when the task is not profiled.
+    """
+    if not TASK_PROFILE_DIR or not (requested or random.random() < TASK_PROFILE_RATE):
+        yield None
+        return
+    if Profiler is None:
+        logger.warning("Task profiling requires the pyinstrument package")
+        yield None
+        return
+
+    path = os.path.join(TASK_PROFILE_DIR, f"{task_id}.html")
+    profiler = Profiler(interval=TASK_PROFILE_INTERVAL)
+    profiler.start()
+    try:
+        yield path
+    finally:
+        profiler.stop()
+        try:
+            os.makedirs(TASK_PROFILE_DIR, exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(profiler.output_html())
+            logger.info(f"Wrote task profile {path}")
+        except OSError as e:
+            logger.warning(f"Could not write task profile {path}: {e}")
+
+
+def instrumented(task_name):
+    """
+    Decorator for bound tasks taking a request payload: collects the task's spans, records
+    them in the task metrics and profiles the task when asked to.
+
+    With options.timings set in the payload, the spans are also returned under the result's
+    'timings' key.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(task, data, *args, **kwargs):
+            options = (data.get('options') or {}) if isinstance(data, dict) else {}
+            started = time.perf_counter()
+            status = 'failure'
+            with collect() as spans, profiled(task.request.id, bool(options.get('profile'))) as profile_path:
+                try:
+                    result = func(task, data, *args, **kwargs)
+                    status = 'success'
+                except Ignore:
+                    status = 'replaced'
+                    raise
+                finally:
+                    seconds = time.perf_counter() - started
+                    task_metrics.record_task(task_name, spans, seconds, status)
+
+            if options.get('timings') and isinstance(result, dict):
+                result['timings'] = {'seconds': seconds, 'profile': profile_path, 'spans': spans}
+            return result
+        return wrapper
+    return decorator
@@ -1,5 +1,6 @@
 # analysis/model.py
 
+import os
 import numpy as np
 import pandas as pd
 import statsmodels.api as sm
@@ -7,12 +8,24 @@ from sklearn.linear_model import LassoCV, RidgeCV
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import TimeSeriesSplit
 import logging
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields
+from . import rolling_ols
+from . import rolling_ridge
+from . import rolling_lasso
+from .downsampling import lttb_indices
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Cross-validation settings shared by the per-window and batched solvers
+RIDGE_ALPHAS = np.logspace(-4, 4, 20)
+LASSO_ALPHAS = np.logspace(-4, 1, 20)
+CV_SPLITS = 3
+
+# 'rolling' warm-starts Lasso across consecutive windows; 'sklearn' refits LassoCV per window
+LASSO_SOLVER = os.getenv('LASSO_SOLVER', 'rolling')
+
 @dataclass
 class RegressionStats:
     coefficients: list
@@ -26,7 +39,7 @@ class RegressionStats:
     intercept: float = 0.0  # Intercept is zero since alpha is not assumed
     score: float = None
 
-def run_regression(returns_df, regression_df, window, model_type, model_label):
+def run_regression(returns_df, regression_df, window, model_type, model_label, result_format='records', max_points=None, state=None):
     """
     Run regression analysis for a given time window and model type.
 
@@ -36,78 +49,240 @@ def run_regression(returns_df, regression_df, window, model_type, model_label):
     - window (int): Rolling window size in months.
     - model_type (str): Type of regression model ('OLS', 'Ridge', 'Lasso').
     - model_label (str): Label indicating 'Absolute' or 'Active'.
+    - result_format (str): Layout of "regression_stats", 'records' or 'columnar' (see format_regression_stats).
+    - max_points (int): If set, keep at most this many windows in the chart data and statistics,
+      chosen with LTTB on the total return. Every window is still fitted.
+    - state (dict): Windows carried over from an earlier run on the same leading rows. Its
+      'window_stats' are reused instead of refitted, and only the windows after them are
+      fitted. Updated in place with every window of this run (see fit_rolling_windows).
 
     Returns:
     - results (dict): Dictionary containing regression results.
     """
     logger.info(f"Running {model_type} regression for {model_label} model with window {window}")
 
+    # Prepare time series data
+    returns_series = returns_df.iloc[:, 0]
+    y_all = returns_series.values
+    X_all = regression_df.values
+
+    # Loop over rolling windows, skipping the ones carried over from an earlier run
+    try:
+        state = state if state is not None else {}
+        reused = state.get('window_stats', [])
+        window_stats = reused + fit_rolling_windows(X_all[len(reused):], y_all[len(reused):], window, model_type, state)
+        state['window_stats'] = window_stats
+        return regression_results(returns_series.index, y_all, regression_df, window, window_stats, result_format, max_points)
+
+    except Exception as e:
+        logger.error(f"Error during regression: {e}", exc_info=True)
+        raise
+
+def run_regression_batch(returns_df, regression_df, window, model_type, model_label, result_format='records', max_points=None):
+    """
+    run_regression for several return series over the same months and factors.
+
+    OLS and Ridge decompose each window's factor matrix once for all series (see
+    fit_rolling_windows_batch).
+
+    Parameters:
+    - returns_df (pd.DataFrame): One column of returns per series.
+    - Other parameters as for run_regression.
+
+    Returns:
+    - results (dict): run_regression results by returns_df column.
+    """
+    logger.info(f"Running {model_type} regression for {model_label} model with window {window} on {returns_df.shape[1]} series")
+
+    Y_all = returns_df.to_numpy(dtype=float)
+    try:
+        window_stats = fit_rolling_windows_batch(regression_df.values, Y_all, window, model_type)
+        return {
+            column: regression_results(returns_df.index, Y_all[:, j], regression_df, window, window_stats[j], result_format, max_points)
+            for j, column in enumerate(returns_df.columns)
+        }
+    except Exception as e:
+        logger.error(f"Error during regression: {e}", exc_info=True)
+        raise
+
+def regression_results(dates, y_all, regression_df, window, window_stats, result_format='records', max_points=None):
+    """
+    Chart data and statistics of a rolling regression from its per-window statistics.
+
+    Parameters:
+    - dates (pd.DatetimeIndex): Months of the returns.
+    - y_all (np.array): Returns for every month.
+    - regression_df (pd.DataFrame): DataFrame of regression factors.
+    - window (int): Rolling window size in months.
+    - window_stats (list[RegressionStats]): Statistics of each window, ordered by end date.
+    - result_format, max_points: As for run_regression.
+
+    Returns:
+    - results (dict): Dictionary containing regression results.
+    """
     results = {
         "labels": [],    # Dates
         "datasets": [],  # Factor contributions and residuals
         "regression_stats": {}
     }
-
-    # Initialize datasets
     factor_names = regression_df.columns.tolist()
-    for factor in factor_names:
-        results["datasets"].append({
-            "label": factor,
-            "data": []
-        })
-
-    # Add datasets for residuals and total return
-    results["datasets"].append({
-        "label": "Residuals",
-        "data": []
-    })
-    results["datasets"].append({
-        "label": "Total Return",
-        "data": []
-    })
+    X_all = regression_df.values
 
-    # Prepare time series data
-    returns_series = returns_df.iloc[:, 0]
-    dates = returns_series.index
+    n_windows = len(window_stats)
+    results["labels"] = dates[window - 1:window - 1 + n_windows].strftime('%Y-%m-%d').tolist()
 
-    # Loop over rolling windows
-    try:
-        for end_idx in range(window, len(returns_series) + 1):
-            start_idx = end_idx - window
-            y = returns_series.iloc[start_idx:end_idx].values
-            X = regression_df.iloc[start_idx:end_idx].values
+    # Each window's factor contributions on its last observation, for all windows at once
+    coefficients = np.array([stats.coefficients for stats in window_stats], dtype=float).reshape(n_windows, len(factor_names))
+    factor_returns = X_all[window - 1:window - 1 + n_windows]
+    total_returns = y_all[window - 1:window - 1 + n_windows].astype(float)
+    factor_contributions = np.ascontiguousarray((coefficients * factor_returns).T)
 
-            date = dates[end_idx - 1].strftime('%Y-%m-%d')
-            results["labels"].append(date)
+    # Residual is the difference between actual return and predicted return
+    residuals = total_returns - np.einsum('ij,ij->i', coefficients, factor_returns)
 
-            # Fit the model and get stats
-            model, stats = fit_model_and_get_stats(X, y, model_type)
+    # Optionally keep only the windows LTTB picks from the total return series
+    if max_points:
+        keep = lttb_indices(total_returns, max_points)
+        results["labels"] = [results["labels"][i] for i in keep]
+        window_stats = [window_stats[i] for i in keep]
+        factor_contributions = np.ascontiguousarray(factor_contributions[:, keep])
+        residuals = residuals[keep]
+        total_returns = total_returns[keep]
 
-            # Calculate factor contributions
-            coefficients = np.array(stats.coefficients)
-            factor_returns = regression_df.iloc[end_idx - 1].values
-            factor_contributions = coefficients * factor_returns
+    # Factor contributions, then residuals and total return
+    for factor, contributions in zip(factor_names, factor_contributions):
+        results["datasets"].append({"label": factor, "data": contributions})
+    results["datasets"].append({"label": "Residuals", "data": residuals})
+    results["datasets"].append({"label": "Total Return", "data": total_returns})
 
-            # Residual is the difference between actual return and predicted return
-            predicted_return = np.dot(coefficients, factor_returns)
-            residual = y[-1] - predicted_return
+    # Store regression stats
+    results["regression_stats"] = format_regression_stats(results["labels"], window_stats, result_format)
+    return results
 
-            # Append factor contributions and residuals to datasets
-            for idx, contribution in enumerate(factor_contributions):
-                results["datasets"][idx]["data"].append(float(contribution))
+def format_regression_stats(dates, window_stats, result_format='records'):
+    """
+    Lay out per-window regression statistics for the results payload.
 
-            # Append residuals and total return
-            results["datasets"][-2]["data"].append(float(residual))
-            results["datasets"][-1]["data"].append(float(y[-1]))
+    Parameters:
+    - dates (list[str]): Window end dates, one per entry of window_stats.
+    - window_stats (list[RegressionStats]): Statistics for each window.
+    - result_format (str): 'records' maps each date to that window's statistics. 'columnar' holds
+      one list per statistic aligned with the regression "labels" (coefficients and p_values
+      become date-by-factor matrices); statistics the model does not produce are None.
 
-            # Store regression stats
-            results["regression_stats"][date] = asdict(stats)
+    Returns:
+    - regression_stats (dict): Statistics in the requested layout.
+    """
+    if result_format == 'records':
+        return {date: asdict(stats) for date, stats in zip(dates, window_stats)}
+    if result_format != 'columnar':
+        raise ValueError(f"Unknown result_format: {result_format}")
 
-    except Exception as e:
-        logger.error(f"Error during regression: {e}", exc_info=True)
-        raise
+    regression_stats = {}
+    for field in fields(RegressionStats):
+        values = [getattr(stats, field.name) for stats in window_stats]
+        regression_stats[field.name] = None if values and all(value is None for value in values) else values
+    return regression_stats
 
-    return results
+def fit_rolling_windows(X, y, window, model_type, state=None):
+    """
+    Fit the regression model on every rolling window of the data.
+
+    OLS and Ridge are solved for all windows in one batched pass. Lasso is
+    warm-started from the previous window's solution unless LASSO_SOLVER is
+    set to 'sklearn', in which case LassoCV is refitted window by window.
+
+    Parameters:
+    - X (np.array): Predictor variables for the full history.
+    - y (np.array): Response variable for the full history.
+    - window (int): Rolling window size in months.
+    - model_type (str): Type of regression model ('OLS', 'Ridge', 'Lasso').
+    - state (dict): Solver state carried between calls on consecutive stretches of a history.
+      The rolling Lasso starts from its 'warm_start' and stores its last solutions back.
+
+    Returns:
+    - window_stats (list[RegressionStats]): Statistics for each window, ordered by end date.
+    """
+    if model_type == "OLS":
+        return window_stats_from_fitted(rolling_ols.rolling_ols(X, y, window), model_type)
+    if model_type == "Ridge":
+        fitted = rolling_ridge.rolling_ridge(X, y, window, RIDGE_ALPHAS, TimeSeriesSplit(n_splits=CV_SPLITS))
+        return window_stats_from_fitted(fitted, model_type)
+    if model_type == "Lasso" and LASSO_SOLVER == "rolling":
+        state = state if state is not None else {}
+        fitted = rolling_lasso.rolling_lasso(
+            X, y, window, LASSO_ALPHAS, TimeSeriesSplit(n_splits=CV_SPLITS), warm_start=state.get('warm_start')
+        )
+        state['warm_start'] = fitted['warm_start']
+        return window_stats_from_fitted(fitted, model_type)
+
+    window_stats = []
+    for end_idx in range(window, len(y) + 1):
+        start_idx = end_idx - window
+        _, stats = fit_model_and_get_stats(X[start_idx:end_idx], y[start_idx:end_idx], model_type)
+        window_stats.append(stats)
+    return window_stats
+
+def fit_rolling_windows_batch(X, Y, window, model_type):
+    """
+    fit_rolling_windows for several responses sharing the same predictors.
+
+    OLS and Ridge are solved as multi-response problems: each window's decompositions are
+    computed once and applied to every response, while every response keeps its own statistics
+    (and, for Ridge, its own cross-validated alpha). Lasso is fitted response by response.
+
+    Parameters:
+    - X (np.array): Predictor variables for the full history, shape (n, k).
+    - Y (np.array): One column per response, shape (n, m).
+    - window (int): Rolling window size in months.
+    - model_type (str): Type of regression model ('OLS', 'Ridge', 'Lasso').
+
+    Returns:
+    - window_stats (list[list[RegressionStats]]): fit_rolling_windows output for each response.
+    """
+    if model_type == "OLS":
+        fitted = rolling_ols.rolling_ols(X, Y, window)
+    elif model_type == "Ridge":
+        fitted = rolling_ridge.rolling_ridge(X, Y, window, RIDGE_ALPHAS, TimeSeriesSplit(n_splits=CV_SPLITS))
+    else:
+        return [fit_rolling_windows(X, Y[:, j], window, model_type) for j in range(Y.shape[1])]
+    return [
+        window_stats_from_fitted({name: values[:, j] for name, values in fitted.items()}, model_type)
+        for j in range(Y.shape[1])
+    ]
+
+def window_stats_from_fitted(fitted, model_type):
+    """
+    Per-window RegressionStats from the arrays of a batched rolling solver.
+
+    Parameters:
+    - fitted (dict): Output of rolling_ols, rolling_ridge or rolling_lasso for one response.
+    - model_type (str): Type of regression model ('OLS', 'Ridge', 'Lasso').
+
+    Returns:
+    - window_stats (list[RegressionStats]): Statistics for each window, ordered by end date.
+    """
+    if model_type == "OLS":
+        return [
+            RegressionStats(
+                coefficients=fitted['coefficients'][i].tolist(),
+                r_squared=float(fitted['r_squared'][i]),
+                adj_r_squared=float(fitted['adj_r_squared'][i]),
+                p_values=fitted['p_values'][i].tolist(),
+                f_statistic=float(fitted['f_statistic'][i]),
+                aic=float(fitted['aic'][i]),
+                bic=float(fitted['bic'][i])
+            )
+            for i in range(len(fitted['r_squared']))
+        ]
+    return [
+        RegressionStats(
+            coefficients=fitted['coefficients'][i].tolist(),
+            best_alpha=float(fitted['best_alpha'][i]),
+            score=float(fitted['score'][i])
+        )
+        for i in range(len(fitted['score']))
+    ]
 
 def fit_model_and_get_stats(X, y, model_type):
     """
@@ -145,10 +320,9 @@ def fit_model_and_get_stats(X, y, model_type):
             bic=model.bic
         )
     elif model_type == "Ridge":
-        alphas = np.logspace(-4, 4, 20)
-        tscv = TimeSeriesSplit(n_splits=3)
+        tscv = TimeSeriesSplit(n_splits=CV_SPLITS)
         model = RidgeCV(
-            alphas=alphas,
+            alphas=RIDGE_ALPHAS,
             fit_intercept=False,
             cv=tscv,
             scoring='r2',
@@ -163,10 +337,9 @@ def fit_model_and_get_stats(X, y, model_type):
             score=model.score(X_scaled, y)
         )
     elif model_type == "Lasso":
-        alphas = np.logspace(-4, 1, 20)
-        tscv = TimeSeriesSplit(n_splits=3)
+        tscv = TimeSeriesSplit(n_splits=CV_SPLITS)
         model = LassoCV(
-            alphas=alphas,
+            alphas=LASSO_ALPHAS,
             cv=tscv,
             max_iter=10000,
             fit_intercept=False,
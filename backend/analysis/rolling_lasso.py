@@ -0,0 +1,192 @@
+# analysis/rolling_lasso.py
+
+import numpy as np
+# Private, but its signature has been stable across scikit-learn 1.x releases
+from sklearn.linear_model._cd_fast import enet_coordinate_descent_gram
+
+# Only consulted for random coordinate selection, which the rolling solver does not use
+_RNG = np.random.RandomState(42)
+
+
+class SlidingMoments:
+    """
+    Raw cross-product sums over a set of fixed-length row ranges that slide together.
+
+    Each range is described by an offset and a length relative to the start of the
+    current window. Advancing by one row adds the entering observation's cross-products
+    and subtracts the leaving one's, so every range costs O(k²) per step.
+    """
+
+    def __init__(self, X, y, offsets, lengths):
+        self.X = X
+        self.y = y
+        self.offsets = np.asarray(offsets)
+        self.lengths = np.asarray(lengths)
+        self.start = 0
+
+        self.xx = np.stack([X[o:o + n].T @ X[o:o + n] for o, n in zip(self.offsets, self.lengths)])
+        self.x = np.stack([X[o:o + n].sum(axis=0) for o, n in zip(self.offsets, self.lengths)])
+        self.xy = np.stack([X[o:o + n].T @ y[o:o + n] for o, n in zip(self.offsets, self.lengths)])
+        self.y_sum = np.array([y[o:o + n].sum() for o, n in zip(self.offsets, self.lengths)])
+        self.yy = np.array([y[o:o + n] @ y[o:o + n] for o, n in zip(self.offsets, self.lengths)])
+
+    def advance(self):
+        """Slide every range forward by one observation."""
+        leaving = self.start + self.offsets
+        entering = leaving + self.lengths
+        X_in, X_out = self.X[entering], self.X[leaving]
+        y_in, y_out = self.y[entering], self.y[leaving]
+
+        self.xx += X_in[:, :, None] * X_in[:, None, :] - X_out[:, :, None] * X_out[:, None, :]
+        self.x += X_in - X_out
+        self.xy += X_in * y_in[:, None] - X_out * y_out[:, None]
+        self.y_sum += y_in - y_out
+        self.yy += y_in ** 2 - y_out ** 2
+        self.start += 1
+
+    def standardized(self, mean, scale):
+        """
+        Gram matrices and X'y of the ranges after standardizing X with the given mean and scale.
+
+        Parameters:
+        - mean (np.array): Feature means, shape (k,).
+        - scale (np.array): Feature scales, shape (k,).
+
+        Returns:
+        - gram (np.array): Shape (n_ranges, k, k).
+        - xy (np.array): Shape (n_ranges, k).
+        - yy (np.array): Shape (n_ranges,).
+        """
+        n = self.lengths[:, None, None]
+        cross = self.x[:, :, None] * mean[None, None, :]
+        gram = (self.xx - cross - cross.transpose(0, 2, 1) + n * np.outer(mean, mean)) / np.outer(scale, scale)
+        xy = (self.xy - mean[None, :] * self.y_sum[:, None]) / scale
+        return gram, xy, self.yy.copy()
+
+
+def lasso_coordinate_descent(gram, xy, y, alpha, coefficients, max_iter=10000, tol=1e-4):
+    """
+    Solve a no-intercept Lasso from a precomputed Gram matrix, starting from `coefficients`.
+
+    Uses sklearn's compiled Gram coordinate descent (the routine Lasso runs when
+    precompute is enabled) with cyclic coordinate selection.
+
+    Parameters:
+    - gram (np.array): Gram matrix X'X, shape (k, k).
+    - xy (np.array): X'y, shape (k,).
+    - y (np.array): Response variable; only its norm is used, for the duality gap tolerance.
+    - alpha (float): Lasso penalty on the sklearn (1 / (2 * n_samples)) scale.
+    - coefficients (np.array): Warm start, shape (k,). Updated in place.
+    - max_iter (int): Maximum number of coordinate descent sweeps.
+    - tol (float): Duality gap tolerance relative to y'y.
+
+    Returns:
+    - coefficients (np.array): Solution, shape (k,).
+    """
+    coefficients, _, _, _ = enet_coordinate_descent_gram(
+        coefficients, alpha * len(y), 0.0, gram, xy, y, max_iter, tol, _RNG, 0, 0
+    )
+    return np.asarray(coefficients)
+
+
+def rolling_lasso(X, y, window, alphas, cv, max_iter=10000, tol=1e-4, warm_start=None):
+    """
+    Fit a cross-validated, no-intercept Lasso on every rolling window with warm starts.
+
+    Follows LassoCV(fit_intercept=False, cv=cv) applied to standardized features window by
+    window: every alpha is scored by mean validation MSE over the folds and the winner is refitted
+    on the full window. Each (fold, alpha) problem and the refit start from the previous window's
+    solution, and the Gram matrices come from raw sums that slide one observation at a time.
+    With short windows (12 months of 5 factors gives 3-row training folds) the fold problems
+    have no unique solution, so the warm start can select a different alpha than a cold fit.
+
+    Parameters:
+    - X (np.array): Predictor variables, shape (n, k).
+    - y (np.array): Response variable, shape (n,).
+    - window (int): Rolling window size.
+    - alphas (np.array): Candidate regularization strengths.
+    - cv: Cross-validation splitter (e.g. TimeSeriesSplit) applied within each window.
+    - max_iter (int): Maximum coordinate descent sweeps per window.
+    - tol (float): Duality gap tolerance relative to y'y.
+    - warm_start (dict): 'warm_start' of an earlier call whose last window immediately precedes
+      the first window of X, so the solution path continues where that call stopped.
+
+    Returns:
+    - results (dict): 'coefficients' on the original feature scale, shape (n_windows, k),
+      'best_alpha' and 'score' (in-window R² of the refitted model), shape (n_windows,), and
+      'warm_start', the standardized solutions of the last window.
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if not (np.isfinite(X).all() and np.isfinite(y).all()):
+        raise ValueError("Input contains NaN or infinity.")
+
+    # LassoCV walks the alpha grid from strongest to weakest and keeps the first minimum
+    alphas = np.sort(np.asarray(alphas, dtype=float))[::-1]
+    n_windows = max(len(y) - window + 1, 0)
+    k = X.shape[1]
+
+    if n_windows == 0:
+        return {'coefficients': np.empty((0, k)), 'best_alpha': np.empty(0), 'score': np.empty(0), 'warm_start': warm_start}
+
+    folds = [(train_idx, test_idx) for train_idx, test_idx in cv.split(np.empty((window, 1)))]
+    n_folds = len(folds)
+    # Ranges: full window, then each fold's training block, then each fold's test block
+    offsets = [0] + [train[0] for train, _ in folds] + [test[0] for _, test in folds]
+    lengths = [window] + [len(train) for train, _ in folds] + [len(test) for _, test in folds]
+    moments = SlidingMoments(X, y, offsets, lengths)
+    test_lengths = np.array(lengths[n_folds + 1:], dtype=float)
+
+    fold_coefficients = np.zeros((n_folds, len(alphas), k))
+    full_coefficients = np.zeros(k)
+    if warm_start is not None:
+        fold_coefficients[:] = warm_start['fold_coefficients']
+        full_coefficients[:] = warm_start['full_coefficients']
+    results = {
+        'coefficients': np.empty((n_windows, k)),
+        'best_alpha': np.empty(n_windows),
+        'score': np.empty(n_windows),
+    }
+
+    for w in range(n_windows):
+        if w > 0:
+            moments.advance()
+
+        X_window = X[w:w + window]
+        mean = X_window.mean(axis=0)
+        scale = X_window.std(axis=0)
+        scale[scale < 10 * np.finfo(float).eps] = 1.0
+        gram, xy, yy = moments.standardized(mean, scale)
+
+        # Warm-start every (fold, alpha) problem from the previous window's solution
+        for f, (train_idx, _) in enumerate(folds):
+            gram_f = np.ascontiguousarray(gram[1 + f])
+            y_train = y[w + train_idx]
+            for a, alpha in enumerate(alphas):
+                fold_coefficients[f, a] = lasso_coordinate_descent(
+                    gram_f, xy[1 + f], y_train, alpha, fold_coefficients[f, a], max_iter=max_iter, tol=tol
+                )
+
+        # Validation MSE from the test blocks' moments
+        test = slice(n_folds + 1, None)
+        Gw = np.einsum('fkj,faj->fak', gram[test], fold_coefficients)
+        test_sse = (yy[test][:, None] - 2 * np.einsum('fak,fk->fa', fold_coefficients, xy[test])
+                    + np.einsum('fak,fak->fa', fold_coefficients, Gw))
+        mean_mse = (test_sse / test_lengths[:, None]).mean(axis=0)
+        best_alpha = alphas[np.argmin(mean_mse)]
+
+        y_window = y[w:w + window]
+        full_coefficients = lasso_coordinate_descent(
+            np.ascontiguousarray(gram[0]), xy[0], y_window, best_alpha, full_coefficients,
+            max_iter=max_iter, tol=tol
+        )
+
+        ssr = yy[0] - 2 * full_coefficients @ xy[0] + full_coefficients @ gram[0] @ full_coefficients
+        tss = ((y_window - y_window.mean()) ** 2).sum()
+
+        results['coefficients'][w] = full_coefficients / scale
+        results['best_alpha'][w] = best_alpha
+        results['score'][w] = (1.0 if ssr == 0 else 0.0) if tss == 0 else 1 - ssr / tss
+
+    results['warm_start'] = {'fold_coefficients': fold_coefficients, 'full_coefficients': full_coefficients}
+    return results
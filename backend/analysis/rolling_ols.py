@@ -0,0 +1,103 @@
+# analysis/rolling_ols.py
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import stats
+
+
+def rolling_windows(values, window):
+    """
+    Stack every contiguous window of an array along a new leading axis.
+
+    Parameters:
+    - values (np.array): Array of shape (n,) or (n, k).
+    - window (int): Window length.
+
+    Returns:
+    - windows (np.array): Read-only view of shape (n - window + 1, window) or (n - window + 1, window, k).
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) < window:
+        return np.empty((0, window) + values.shape[1:])
+    return np.moveaxis(sliding_window_view(values, window, axis=0), -1, 1)
+
+
+def rolling_ols(X, y, window):
+    """
+    Fit a no-intercept OLS regression on every rolling window in one batched pass.
+
+    Mirrors the statistics reported by statsmodels' OLS results for a design without
+    a constant column, so the output can be used in place of a per-window `sm.OLS(...).fit()`.
+    Several responses can be fitted against the same predictors at once: each window's
+    pseudo-inverse is computed once and applied to all of them.
+
+    Parameters:
+    - X (np.array): Predictor variables, shape (n, k).
+    - y (np.array): Response variable, shape (n,), or one column per response, shape (n, m).
+    - window (int): Rolling window size.
+
+    Returns:
+    - results (dict): Arrays with one entry per window ending at index window - 1 .. n - 1:
+      'coefficients' and 'p_values' of shape (n_windows, k), and 'r_squared', 'adj_r_squared',
+      'f_statistic', 'aic' and 'bic' of shape (n_windows,). With several responses, every
+      array has a response axis after the window axis, e.g. (n_windows, m, k).
+    """
+    y = np.asarray(y, dtype=float)
+    Y = y[:, None] if y.ndim == 1 else y
+    X_windows = rolling_windows(X, window)
+    Y_windows = rolling_windows(Y, window)
+    n_windows = len(Y_windows)
+    k = X_windows.shape[-1]
+    m = Y.shape[1]
+
+    if n_windows == 0:
+        empty = np.empty((0, m))
+        results = {
+            'coefficients': np.empty((0, m, k)),
+            'r_squared': empty,
+            'adj_r_squared': empty,
+            'p_values': np.empty((0, m, k)),
+            'f_statistic': empty,
+            'aic': empty,
+            'bic': empty,
+        }
+        return {name: values[:, 0] for name, values in results.items()} if y.ndim == 1 else results
+
+    # Same pseudo-inverse solution statsmodels uses, applied to the whole stack at once
+    pinv_X = np.linalg.pinv(X_windows, rcond=1e-15)
+    coefficients = np.einsum('wkn,wnm->wmk', pinv_X, Y_windows)
+    normalized_cov = np.einsum('wkn,wjn->wkj', pinv_X, pinv_X)
+    rank = np.linalg.matrix_rank(X_windows).astype(float)
+
+    residuals = Y_windows - np.einsum('wnk,wmk->wnm', X_windows, coefficients)
+    ssr = np.einsum('wnm,wnm->wm', residuals, residuals)
+    uncentered_tss = np.einsum('wnm,wnm->wm', Y_windows, Y_windows)
+    nobs = float(window)
+    df_model = rank[:, None]
+    df_resid = nobs - df_model
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_squared = 1 - ssr / uncentered_tss
+        adj_r_squared = 1 - nobs / df_resid * (1 - r_squared)
+        scale = ssr / df_resid
+        f_statistic = ((uncentered_tss - ssr) / df_model) / scale
+
+        bse = np.sqrt(np.diagonal(normalized_cov, axis1=1, axis2=2)[:, None, :] * scale[:, :, None])
+        t_values = coefficients / bse
+        p_values = 2 * stats.t.sf(np.abs(t_values), df_resid[:, :, None])
+
+        llf = -nobs / 2 * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+    aic = -2 * llf + 2 * df_model
+    bic = -2 * llf + np.log(nobs) * df_model
+
+    results = {
+        'coefficients': coefficients,
+        'r_squared': r_squared,
+        'adj_r_squared': adj_r_squared,
+        'p_values': p_values,
+        'f_statistic': f_statistic,
+        'aic': aic,
+        'bic': bic,
+    }
+    # A single response keeps the one-dimensional layout
+    return {name: values[:, 0] for name, values in results.items()} if y.ndim == 1 else results
@@ -0,0 +1,136 @@
+# analysis/rolling_ridge.py
+
+import numpy as np
+from .rolling_ols import rolling_windows
+
+# Responses scored together in rolling_ridge; predictions take windows x chunk x alphas x test rows
+RESPONSE_CHUNK_SIZE = 32
+
+
+def standardize_windows(X_windows):
+    """
+    Standardize each window's features the way StandardScaler does.
+
+    Parameters:
+    - X_windows (np.array): Stacked windows, shape (n_windows, window, k).
+
+    Returns:
+    - X_scaled (np.array): Zero-mean, unit-variance windows, same shape as the input.
+    - scale (np.array): Per-window feature scale, shape (n_windows, k). Constant features get a scale of 1.
+    """
+    mean = X_windows.mean(axis=1, keepdims=True)
+    scale = X_windows.std(axis=1)
+    scale[scale < 10 * np.finfo(float).eps] = 1.0
+    return (X_windows - mean) / scale[:, None, :], scale
+
+
+def ridge_path(U, s, Vt, y, alphas):
+    """
+    Solve a no-intercept ridge regression for every alpha from each window's SVD.
+
+    The decomposition depends only on the predictors, so it is computed once and reused for
+    every response.
+
+    Parameters:
+    - U, s, Vt (np.array): Thin SVD of the predictors, shapes (n_windows, n, r), (n_windows, r)
+      and (n_windows, r, k).
+    - y (np.array): Responses, shape (n_windows, n, m).
+    - alphas (np.array): Regularization strengths, shape (n_alphas,).
+
+    Returns:
+    - coefficients (np.array): Shape (n_windows, m, n_alphas, k).
+    """
+    Uty = np.einsum('wnr,wnm->wmr', U, y)
+    shrinkage = s[:, None, :] / (s[:, None, :] ** 2 + alphas[None, :, None])
+    return np.einsum('wmar,wrk->wmak', shrinkage[:, None] * Uty[:, :, None], Vt)
+
+
+def r2_scores(y_true, y_pred):
+    """
+    Coefficient of determination along the last axis, matching sklearn's r2_score.
+
+    Parameters:
+    - y_true (np.array): Observed values, shape (..., n).
+    - y_pred (np.array): Predicted values, broadcastable against y_true.
+
+    Returns:
+    - scores (np.array): R² with the last axis reduced.
+    """
+    ssr = ((y_true - y_pred) ** 2).sum(axis=-1)
+    tss = ((y_true - y_true.mean(axis=-1, keepdims=True)) ** 2).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = 1 - ssr / tss
+    # sklearn scores a perfect fit of a constant target as 1 and an imperfect one as 0
+    return np.where(tss == 0, np.where(ssr == 0, 1.0, 0.0), scores)
+
+
+def rolling_ridge(X, y, window, alphas, cv, chunk_size=RESPONSE_CHUNK_SIZE):
+    """
+    Fit a cross-validated, no-intercept ridge regression on every rolling window.
+
+    Reproduces RidgeCV(fit_intercept=False, cv=cv, scoring='r2') applied to standardized
+    features window by window, but scores every alpha from a single SVD per fold and
+    solves all windows of the same length together. Several responses can be fitted against
+    the same predictors at once, sharing each window's decompositions; each response still
+    selects its own alpha.
+
+    Parameters:
+    - X (np.array): Predictor variables, shape (n, k).
+    - y (np.array): Response variable, shape (n,), or one column per response, shape (n, m).
+    - window (int): Rolling window size.
+    - alphas (np.array): Candidate regularization strengths.
+    - cv: Cross-validation splitter (e.g. TimeSeriesSplit) applied within each window.
+    - chunk_size (int): Responses scored together, which bounds the memory used per fold.
+
+    Returns:
+    - results (dict): 'coefficients' on the original feature scale, shape (n_windows, k),
+      'best_alpha' and 'score' (in-window R² of the refitted model), shape (n_windows,). With
+      several responses, every array has a response axis after the window axis.
+    """
+    alphas = np.asarray(alphas, dtype=float)
+    y = np.asarray(y, dtype=float)
+    Y = y[:, None] if y.ndim == 1 else y
+    X_windows = rolling_windows(X, window)
+    Y_windows = rolling_windows(Y, window)
+    n_windows = len(Y_windows)
+    k = X_windows.shape[-1]
+    m = Y.shape[1]
+    chunks = [slice(start, start + chunk_size) for start in range(0, m, chunk_size)]
+
+    if n_windows == 0:
+        results = {'coefficients': np.empty((0, m, k)), 'best_alpha': np.empty((0, m)), 'score': np.empty((0, m))}
+        return {name: values[:, 0] for name, values in results.items()} if y.ndim == 1 else results
+
+    X_scaled, scale = standardize_windows(X_windows)
+
+    # Mean validation R² per window, response and alpha, as GridSearchCV averages over folds
+    cv_scores = np.zeros((n_windows, m, len(alphas)))
+    n_folds = 0
+    for train_idx, test_idx in cv.split(np.empty((window, 1))):
+        U, s, Vt = np.linalg.svd(X_scaled[:, train_idx], full_matrices=False)
+        for chunk in chunks:
+            fold_coefficients = ridge_path(U, s, Vt, Y_windows[:, train_idx, chunk], alphas)
+            predictions = np.einsum('wnk,wmak->wman', X_scaled[:, test_idx], fold_coefficients)
+            y_test = np.moveaxis(Y_windows[:, test_idx, chunk], 1, 2)
+            cv_scores[:, chunk] += r2_scores(y_test[:, :, None, :], predictions)
+        n_folds += 1
+    cv_scores /= n_folds
+
+    # First alpha with the highest mean score wins; NaN scores rank last
+    best_idx = np.argmax(np.where(np.isnan(cv_scores), -np.inf, cv_scores), axis=2)
+    best_alpha = alphas[best_idx]
+
+    # Refit on the full window with the selected alpha
+    U, s, Vt = np.linalg.svd(X_scaled, full_matrices=False)
+    Uty = np.einsum('wnr,wnm->wmr', U, Y_windows)
+    shrinkage = s[:, None, :] / (s[:, None, :] ** 2 + best_alpha[:, :, None])
+    scaled_coefficients = np.einsum('wmr,wrk->wmk', shrinkage * Uty, Vt)
+    fitted = np.einsum('wnk,wmk->wmn', X_scaled, scaled_coefficients)
+
+    results = {
+        'coefficients': scaled_coefficients / scale[:, None, :],
+        'best_alpha': best_alpha,
+        'score': r2_scores(np.moveaxis(Y_windows, 1, 2), fitted),
+    }
+    # A single response keeps the one-dimensional layout
+    return {name: values[:, 0] for name, values in results.items()} if y.ndim == 1 else results
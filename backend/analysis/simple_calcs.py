@@ -1,50 +1,66 @@
 import numpy as np
 import pandas as pd
-import json
+from .downsampling import downsample_chart
 
 
-def format_json(data_series, label):
+def format_chart(data_series, label):
     # Filter out NaN values and get their corresponding dates
     filtered_series = data_series.dropna()
     dates = filtered_series.index.strftime('%Y-%m-%d').tolist()
 
-    # Prepare data for JSON output
+    # Chart data; the values stay a NumPy array until the result is encoded
     data = {
         "labels": dates,
         "datasets": [
             {
                 "label": label,
-                "data": filtered_series.tolist(),
+                "data": filtered_series.to_numpy(dtype=float),
                 "borderColor": "blue" if "Return" in label else "red",
                 "fill": False
             }
         ]
     }
 
-    return json.dumps(data, indent=4)
+    return data
 
 
-def calculate_and_format_rolling(return_df, months):
+def calculate_and_format_rolling(return_df, months, max_points=None):
     # Calculate rolling return, removing NaN values
-    return_rolling = return_df.iloc[:, 0].rolling(window=months).apply(
-        lambda x: (1 + x).prod() ** (12 / months) - 1, raw=False
-    ).dropna()
+    return_rolling = annualized_rolling_return(return_df.iloc[:, 0], months).dropna()
 
     # Calculate rolling volatility, removing NaN values
     rolling_vol = (return_df.iloc[:, 0].rolling(window=months).std() * np.sqrt(12)).dropna()
 
-    # Format JSON without NaN values
-    json_return_rolling = format_json(return_rolling, f"{int(months / 12)}yr Rolling Return")
-    json_rolling_vol = format_json(rolling_vol, f"{int(months / 12)}yr Rolling Volatility")
+    # Format chart data without NaN values
+    return_rolling_chart = format_chart(return_rolling, f"{int(months / 12)}yr Rolling Return")
+    rolling_vol_chart = format_chart(rolling_vol, f"{int(months / 12)}yr Rolling Volatility")
 
-    return json_return_rolling, json_rolling_vol
+    # Optionally thin the charts to max_points with LTTB
+    return_rolling_chart = downsample_chart(return_rolling_chart, max_points)
+    rolling_vol_chart = downsample_chart(rolling_vol_chart, max_points)
+
+    return return_rolling_chart, rolling_vol_chart
 
 
 def annualized_rolling_return(returns, window, periods_per_year=12):
-    def calc_annualized(x):
-        if len(x) < window or x.isnull().any():
-            return np.nan
-        return (1 + x).prod() ** (periods_per_year / len(x)) - 1
+    # Compound each window from a prefix sum of log(1 + r), so every window costs O(1).
+    # A window containing a missing return is NaN, matching rolling() with min_periods=window.
+    values = returns.to_numpy(dtype=float)
+    missing = np.isnan(values)
+    wiped_out = values <= -1
+    log_growth = np.log1p(np.where(missing | wiped_out, 0.0, values))
+
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        growth = np.expm1(window_sums(log_growth, window) * (periods_per_year / window))
+        growth[window_sums(wiped_out, window) > 0] = -1.0
+        growth[window_sums(missing, window) > 0] = np.nan
+        result[window - 1:] = growth
+
+    return pd.Series(result, index=returns.index, name=returns.name)
+
 
-    rolling_cum_return = returns.rolling(window=window).apply(calc_annualized, raw=False)
-    return rolling_cum_return
\ No newline at end of file
+def window_sums(values, window):
+    # Sum of every trailing window of length `window`, one entry per complete window
+    cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=float)))
+    return cumulative[window:] - cumulative[:-window]
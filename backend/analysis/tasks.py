@@ -1,25 +1,44 @@
 # backend/analysis/analysis_main.py
 
-import json
+import os
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from celery import chord
+from celery.exceptions import Ignore
+from celery.utils import uuid
 from . import data_processing
 from . import simple_calcs
 from . import model
 from . import cone_chart
+from . import executors
+from . import analysis_state
+from . import instrumentation
 from celery_app import celery
+import result_cache
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# 'single' runs the whole analysis in one task; 'chord' splits it into one subtask per
+# return type, window and model so large requests spread across the worker fleet
+PROCESS_DATA_MODE = os.getenv('PROCESS_DATA_MODE', 'single')
+
+TIME_FRAMES = [12, 36, 60]
+MODEL_TYPES = ['OLS', 'Ridge', 'Lasso']
+
 @celery.task(bind=True)
+@instrumentation.instrumented('process_data')
 def process_data(self, data):
     """
     Celery task to process input data and generate analysis results.
 
     Parameters:
     - data (dict): Input data containing fund returns, benchmark returns, and regression factors.
+      Its options may set 'timings' to return the stage timings under results['timings'],
+      'profile' to profile the task (see instrumentation.profiled), 'cone_bands' to the standard
+      deviation multiples of the cone chart bands, and 'factor_cones' to add a cone chart per
+      regression factor under results['Absolute'][0]['factor_cone_charts'].
 
     Returns:
     - results (dict): Dictionary containing analysis results.
@@ -27,49 +46,78 @@ def process_data(self, data):
     logger.info("Starting data processing task...")
 
     try:
+        cache_key = result_cache.request_key(data)
+        options = data.get('options') or {}
+        result_format = options.get('result_format', 'records')
+        # Thin long chart series to at most this many points (summary figures use all data)
+        max_points = options.get('max_points')
+
         # Create return DataFrames
         fund_return_df, benchmark_return_df, active_return_df, regression_df = data_processing.create_return_dfs(data)
 
+        # Create the cone charts of both return types together, and optionally of every factor
+        cone_returns = pd.DataFrame({'Absolute': fund_return_df.iloc[:, 0], 'Active': active_return_df.iloc[:, 0]})
+        with instrumentation.span('cone_chart', rows=len(cone_returns), series=2):
+            summaries = {
+                label: {'cone_chart': chart}
+                for label, chart in cone_chart.create_cone_charts(cone_returns, max_points, options.get('cone_bands')).items()
+            }
+        if options.get('factor_cones'):
+            with instrumentation.span('cone_chart', rows=len(regression_df), series=regression_df.shape[1]):
+                summaries['Absolute']['factor_cone_charts'] = cone_chart.create_cone_charts(regression_df, max_points, options.get('cone_bands'))
+
         results = {
-            'Absolute': {12: {}, 36: {}, 60: {}, 0: {}},
-            'Active': {12: {}, 36: {}, 60: {}, 0: {}}
+            'Absolute': {12: {}, 36: {}, 60: {}, 0: summaries['Absolute']},
+            'Active': {12: {}, 36: {}, 60: {}, 0: summaries['Active']}
         }
 
-        # Create cone charts
-        results['Absolute'][0]['cone_chart'] = cone_chart.create_cone_chart(fund_return_df.iloc[:, 0])
-        results['Active'][0]['cone_chart'] = cone_chart.create_cone_chart(active_return_df.iloc[:, 0])
+        if PROCESS_DATA_MODE == 'chord':
+            dispatch_pieces(self, {'Absolute': fund_return_df, 'Active': active_return_df}, regression_df, summaries, cache_key, result_format, max_points)
 
-        # Prepare tasks for parallel execution
-        with ThreadPoolExecutor() as executor:
-            futures = []
-            for return_df, model_label in [(fund_return_df, 'Absolute'), (active_return_df, 'Active')]:
-                for time_frame in [12, 36, 60]:
-                    futures.append(executor.submit(
-                        process_time_frame,
-                        return_df,
-                        regression_df,
-                        time_frame,
-                        model_label
-                    ))
-
-            for future in as_completed(futures):
-                try:
-                    model_label, time_frame, result = future.result()
-                    results[model_label][time_frame] = result
-                except Exception as e:
-                    logger.error(f"Error processing {model_label} for {time_frame}-month window: {e}", exc_info=True)
-                    results[model_label][time_frame] = {'error': str(e)}
+        # Resume the rolling windows of an earlier analysis of this fund whose inputs are unchanged
+        state_key = analysis_state.state_key(data)
+        state_inputs = {
+            'Absolute': analysis_state.input_arrays(fund_return_df, regression_df),
+            'Active': analysis_state.input_arrays(active_return_df, regression_df)
+        }
+        with instrumentation.span('load_state'):
+            states, keep_state = analysis_state.load_state(state_key, state_inputs)
+
+        # Fan the time frames out on the configured execution backend (threads, processes or serial)
+        jobs = []
+        for return_df, model_label in [(fund_return_df, 'Absolute'), (active_return_df, 'Active')]:
+            for time_frame in TIME_FRAMES:
+                model_states = states.get(model_label, {}).get(time_frame)
+                jobs.append(((model_label, time_frame), (return_df, regression_df, time_frame, model_label, result_format, max_points, model_states)))
+
+        for (model_label, time_frame), outcome, error in executors.run_jobs(process_time_frame, jobs):
+            if error is None:
+                results[model_label][time_frame] = outcome[2]
+                states.setdefault(model_label, {})[time_frame] = outcome[3]
+                instrumentation.add_spans(outcome[4])
+            else:
+                logger.error(f"Error processing {model_label} for {time_frame}-month window: {error}", exc_info=error)
+                results[model_label][time_frame] = {'error': str(error)}
 
+        # Windows that failed may succeed on a retry, so only complete analyses are cached
+        if not any('error' in results[label][time_frame] for label in results for time_frame in TIME_FRAMES):
+            result_cache.remember(cache_key, self.request.id)
+            if keep_state:
+                with instrumentation.span('save_state'):
+                    analysis_state.save_state(state_key, state_inputs, states)
         logger.info("Data processing task completed successfully.")
         return results
 
+    except Ignore:
+        # Raised when the task replaces itself with its chord of subtasks
+        raise
     except Exception as e:
         logger.error(f"Error in process_data task: {e}", exc_info=True)
         # Update task state with error information
         self.update_state(state='FAILURE', meta={'exc': str(e)})
         raise e  # Re-raise the exception to mark the task as failed
 
-def process_time_frame(return_df, regression_df, time_frame, model_label):
+def process_time_frame(return_df, regression_df, time_frame, model_label, result_format='records', max_points=None, model_states=None):
     """
     Process data for a specific time frame and model label.
 
@@ -78,29 +126,251 @@ def process_time_frame(return_df, regression_df, time_frame, model_label):
     - regression_df (pd.DataFrame): DataFrame of regression factors.
     - time_frame (int): Time frame in months.
     - model_label (str): Label indicating 'Absolute' or 'Active'.
+    - result_format (str): Layout of the regression statistics, 'records' or 'columnar'.
+    - max_points (int): Maximum number of points per chart series, or None for every point.
+    - model_states (dict): run_regression state to resume from, by model type.
 
     Returns:
-    - Tuple containing model_label, time_frame, and result dictionary.
+    - Tuple containing model_label, time_frame, result dictionary, the updated model states, and
+      the timing spans of the rolling statistics and each model.
     """
     logger.info(f"Processing {model_label} model for {time_frame}-month window")
 
-    result = {}
+    # Runs on an executor thread or process, so its spans are returned to process_data
+    with instrumentation.collect() as spans:
+        with instrumentation.span('rolling', label=model_label, window=time_frame, rows=len(return_df)):
+            result = compute_rolling(return_df, time_frame, max_points)
 
-    # Rolling returns and volatility
-    return_rolling_json, rolling_vol_json = simple_calcs.calculate_and_format_rolling(return_df, time_frame)
-    result['rolling_return'] = json.loads(return_rolling_json)
-    result['rolling_volatility'] = json.loads(rolling_vol_json)
+        # Regressions
+        model_states = model_states if model_states is not None else {}
+        result['regression_metric'] = {}
+        for model_type in MODEL_TYPES:
+            state = model_states.setdefault(model_type, {})
+            with instrumentation.span(
+                'regression', label=model_label, window=time_frame, model=model_type,
+                rows=len(return_df), factors=regression_df.shape[1]
+            ) as regression_span:
+                regression_span['reused_windows'] = len(state.get('window_stats', []))
+                result['regression_metric'][model_type] = model.run_regression(
+                    return_df, regression_df, time_frame, model_type, model_label, result_format, max_points, state
+                )
 
-    # Regressions
-    ols_regression = model.run_regression(return_df, regression_df, time_frame, "OLS", model_label)
-    ridge_regression = model.run_regression(return_df, regression_df, time_frame, "Ridge", model_label)
-    lasso_regression = model.run_regression(return_df, regression_df, time_frame, "Lasso", model_label)
+    logger.info(f"Completed {model_label} model for {time_frame}-month window")
+    return model_label, time_frame, result, model_states, spans
 
-    result['regression_metric'] = {
-        'OLS': ols_regression,
-        'Ridge': ridge_regression,
-        'Lasso': lasso_regression
+def compute_rolling(return_df, time_frame, max_points=None):
+    """
+    Rolling returns and volatility for a single time frame.
+
+    Returns:
+    - result (dict): 'rolling_return' and 'rolling_volatility' chart data.
+    """
+    return_rolling_chart, rolling_vol_chart = simple_calcs.calculate_and_format_rolling(return_df, time_frame, max_points)
+    return {
+        'rolling_return': return_rolling_chart,
+        'rolling_volatility': rolling_vol_chart
     }
 
-    logger.info(f"Completed {model_label} model for {time_frame}-month window")
-    return model_label, time_frame, result
+@celery.task(bind=True)
+@instrumentation.instrumented('process_batch')
+def process_batch(self, data):
+    """
+    Celery task analyzing a lineup of funds against one benchmark and factor set.
+
+    The benchmarks and factors are loaded once, and funds reporting the same months are solved
+    together, sharing each window's factor decompositions across funds.
+
+    Parameters:
+    - data (dict): As for process_data, with a list of 'funds' in place of 'fund'.
+
+    Returns:
+    - results (dict): process_data results by fund description, in submission order, under
+      'funds'; with options.timings, the stage timings under 'timings' beside them.
+    """
+    logger.info(f"Starting batch processing task for {len(data.get('funds', []))} funds...")
+
+    try:
+        options = data.get('options') or {}
+        result_format = options.get('result_format', 'records')
+        max_points = options.get('max_points')
+        cone_bands = options.get('cone_bands')
+
+        groups = data_processing.create_batch_return_dfs(data)
+
+        results = {}
+        jobs = []
+        for group, (fund_return_df, active_return_df, regression_df) in enumerate(groups):
+            with instrumentation.span('cone_chart', rows=len(fund_return_df), funds=fund_return_df.shape[1]):
+                absolute_cones = cone_chart.create_cone_charts(fund_return_df, max_points, cone_bands)
+                active_cones = cone_chart.create_cone_charts(active_return_df, max_points, cone_bands)
+                factor_cones = cone_chart.create_cone_charts(regression_df, max_points, cone_bands) if options.get('factor_cones') else None
+            for fund in fund_return_df.columns:
+                results[fund] = {
+                    'Absolute': {12: {}, 36: {}, 60: {}, 0: {'cone_chart': absolute_cones[fund]}},
+                    'Active': {12: {}, 36: {}, 60: {}, 0: {'cone_chart': active_cones[fund]}}
+                }
+                if factor_cones is not None:
+                    results[fund]['Absolute'][0]['factor_cone_charts'] = factor_cones
+            for return_df, model_label in [(fund_return_df, 'Absolute'), (active_return_df, 'Active')]:
+                for time_frame in TIME_FRAMES:
+                    jobs.append(((group, model_label, time_frame), (return_df, regression_df, time_frame, model_label, result_format, max_points)))
+
+        for (group, model_label, time_frame), outcome, error in executors.run_jobs(process_batch_time_frame, jobs):
+            if error is None:
+                for fund, result in outcome[2].items():
+                    results[fund][model_label][time_frame] = result
+                instrumentation.add_spans(outcome[3])
+            else:
+                logger.error(f"Error processing {model_label} for {time_frame}-month window: {error}", exc_info=error)
+                for fund in groups[group][0].columns:
+                    results[fund][model_label][time_frame] = {'error': str(error)}
+
+        logger.info("Batch processing task completed successfully.")
+        # Nested, so no fund description can collide with the 'timings' key
+        return {'funds': {fund['description']: results[fund['description']] for fund in data['funds']}}
+
+    except Exception as e:
+        logger.error(f"Error in process_batch task: {e}", exc_info=True)
+        self.update_state(state='FAILURE', meta={'exc': str(e)})
+        raise e
+
+def process_batch_time_frame(return_df, regression_df, time_frame, model_label, result_format='records', max_points=None):
+    """
+    process_time_frame for several funds over the same months.
+
+    Parameters:
+    - return_df (pd.DataFrame): Returns (fund or active), one column per fund.
+    - Other parameters as for process_time_frame.
+
+    Returns:
+    - Tuple containing model_label, time_frame, the result dictionary by fund, and the timing spans.
+    """
+    logger.info(f"Processing {model_label} model for {time_frame}-month window on {return_df.shape[1]} funds")
+
+    n_rows, n_funds = return_df.shape
+    with instrumentation.collect() as spans:
+        regression_metric = {}
+        for model_type in MODEL_TYPES:
+            with instrumentation.span(
+                'regression', label=model_label, window=time_frame, model=model_type,
+                rows=n_rows, factors=regression_df.shape[1], funds=n_funds
+            ):
+                regression_metric[model_type] = model.run_regression_batch(
+                    return_df, regression_df, time_frame, model_type, model_label, result_format, max_points
+                )
+
+        results = {}
+        with instrumentation.span('rolling', label=model_label, window=time_frame, rows=n_rows, funds=n_funds):
+            for fund in return_df.columns:
+                results[fund] = compute_rolling(return_df[[fund]], time_frame, max_points)
+        for fund in return_df.columns:
+            results[fund]['regression_metric'] = {model_type: regression_metric[model_type][fund] for model_type in MODEL_TYPES}
+
+    logger.info(f"Completed {model_label} model for {time_frame}-month window on {return_df.shape[1]} funds")
+    return model_label, time_frame, results, spans
+
+def piece_name(model_label, time_frame, kind):
+    return f"{model_label}/{time_frame}/{kind}"
+
+def dispatch_pieces(task, return_dfs, regression_df, summaries, cache_key=None, result_format='records', max_points=None):
+    """
+    Replace `task` with a chord of per-piece subtasks whose callback assembles the results.
+
+    One piece computes the rolling statistics for each return type and window, and one piece
+    runs each regression model. The piece task IDs are published in the task's PROGRESS meta
+    so /task-status can report which pieces have finished.
+
+    Parameters:
+    - task: The bound process_data task being replaced.
+    - return_dfs (dict): Return DataFrame by model label ('Absolute', 'Active').
+    - regression_df (pd.DataFrame): DataFrame of regression factors.
+    - summaries (dict): Whole-period results (the cone charts) by model label, passed through to the callback.
+    - cache_key (str): Result cache key under which the callback records the finished task.
+    - result_format (str): Layout of the regression statistics, 'records' or 'columnar'.
+    - max_points (int): Maximum number of points per chart series, or None for every point.
+    """
+    regression_payload = frame_to_payload(regression_df)
+    header = []
+    pieces = {}
+    for model_label, return_df in return_dfs.items():
+        return_payload = frame_to_payload(return_df)
+        for time_frame in TIME_FRAMES:
+            for kind in ['rolling'] + MODEL_TYPES:
+                task_id = uuid()
+                pieces[piece_name(model_label, time_frame, kind)] = task_id
+                header.append(process_piece.s(model_label, time_frame, kind, return_payload, regression_payload, result_format, max_points).set(task_id=task_id))
+
+    logger.info(f"Dispatching {len(header)} analysis pieces")
+    task.update_state(state='PROGRESS', meta={'pieces': pieces})
+    raise task.replace(chord(header, assemble_results.s(summaries, cache_key)))
+
+@celery.task
+def process_piece(model_label, time_frame, kind, return_payload, regression_payload, result_format='records', max_points=None):
+    """
+    Celery subtask computing one piece of the analysis.
+
+    Parameters:
+    - model_label (str): Label indicating 'Absolute' or 'Active'.
+    - time_frame (int): Time frame in months.
+    - kind (str): 'rolling' for rolling returns and volatility, or a regression model type.
+    - return_payload (dict): Returns DataFrame in frame_to_payload form.
+    - regression_payload (dict): Regression factor DataFrame in frame_to_payload form.
+    - result_format (str): Layout of the regression statistics, 'records' or 'columnar'.
+    - max_points (int): Maximum number of points per chart series, or None for every point.
+
+    Returns:
+    - piece (dict): Identifies the piece and holds either its 'result' or its 'error'.
+    """
+    piece = {'model_label': model_label, 'time_frame': time_frame, 'kind': kind}
+    try:
+        return_df = frame_from_payload(return_payload)
+        if kind == 'rolling':
+            piece['result'] = compute_rolling(return_df, time_frame, max_points)
+        else:
+            regression_df = frame_from_payload(regression_payload)
+            piece['result'] = model.run_regression(return_df, regression_df, time_frame, kind, model_label, result_format, max_points)
+    except Exception as e:
+        logger.error(f"Error processing {kind} for {model_label} {time_frame}-month window: {e}", exc_info=True)
+        piece['error'] = str(e)
+    return piece
+
+@celery.task(bind=True)
+def assemble_results(self, pieces, summaries, cache_key=None):
+    """
+    Chord callback combining the analysis pieces into the process_data results layout.
+
+    A window whose pieces did not all succeed is reported as an error, as in single-task mode.
+    """
+    results = {
+        label: {**{time_frame: {} for time_frame in TIME_FRAMES}, 0: summaries[label]}
+        for label in summaries
+    }
+    errors = {}
+    for piece in pieces:
+        model_label, time_frame, kind = piece['model_label'], piece['time_frame'], piece['kind']
+        if 'error' in piece:
+            errors.setdefault((model_label, time_frame), piece['error'])
+        elif kind == 'rolling':
+            results[model_label][time_frame].update(piece['result'])
+        else:
+            results[model_label][time_frame].setdefault('regression_metric', {})[kind] = piece['result']
+
+    for (model_label, time_frame), error in errors.items():
+        results[model_label][time_frame] = {'error': error}
+
+    # The chord callback runs under the replaced process_data task's ID
+    if not errors:
+        result_cache.remember(cache_key, self.request.id)
+    logger.info("Data processing task completed successfully.")
+    return results
+
+def frame_to_payload(df):
+    # JSON-safe form of a date-indexed frame for passing between Celery tasks
+    return {
+        'index': df.index.strftime('%Y-%m-%d').tolist(),
+        'columns': df.columns.tolist(),
+        'data': df.values.tolist()
+    }
+
+def frame_from_payload(payload):
+    return pd.DataFrame(payload['data'], index=pd.to_datetime(payload['index']), columns=payload['columns'], dtype=float)
@@ -1,6 +1,7 @@
 import os
 import sys
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from dotenv import load_dotenv
 from flask_cors import CORS
 import logging
@@ -14,12 +15,54 @@ logging.basicConfig(level=logging.DEBUG)
 # Add the backend directory to sys.path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Import the Celery app and task
+# Import the Celery app only: tasks are enqueued and looked up by name, so the analysis
+# modules and their scientific dependencies are only ever imported by the workers
 from celery_app import celery
-from analysis.tasks import process_data
+import result_cache
+import result_encoding
+import task_metrics
+
+PROCESS_DATA_TASK = 'analysis.tasks.process_data'
+PROCESS_BATCH_TASK = 'analysis.tasks.process_batch'
+# Layouts of the regression statistics (see analysis.model.format_regression_stats)
+RESULT_FORMATS = ['records', 'columnar']
+
+def option_errors(data):
+    """
+    Problems with a request's 'options' that would otherwise fail the whole task.
+
+    Returns:
+    - errors (list[str]): One message per invalid option; empty when they are all valid.
+    """
+    options = data.get('options')
+    if options is None:
+        return []
+    if not isinstance(options, dict):
+        return ["options must be an object"]
+
+    errors = []
+    max_points = options.get('max_points')
+    # LTTB keeps the first and last points and at least one in between
+    if max_points is not None and (isinstance(max_points, bool) or not isinstance(max_points, int) or max_points < 3):
+        errors.append("options.max_points must be an integer of at least 3")
+    if options.get('result_format', 'records') not in RESULT_FORMATS:
+        errors.append(f"options.result_format must be one of {RESULT_FORMATS}")
+    cone_bands = options.get('cone_bands')
+    if cone_bands is not None and not (
+        isinstance(cone_bands, list) and cone_bands
+        and all(isinstance(band, (int, float)) and not isinstance(band, bool) and band > 0 for band in cone_bands)
+    ):
+        errors.append("options.cone_bands must be a list of positive numbers")
+    return errors
+
+class ResultJSONProvider(DefaultJSONProvider):
+    # Encode responses with the same single-pass encoder the workers store results with
+    def dumps(self, obj, **kwargs):
+        return result_encoding.encode_json(obj).decode('utf-8')
 
 # Initialize Flask app
 app = Flask(__name__, static_folder='static', static_url_path='/')
+app.json = ResultJSONProvider(app)
 CORS(app)  # Enable CORS
 
 # Route to accept data and enqueue a background task
@@ -28,9 +71,24 @@ def submit_data():
     data = request.get_json()
     logging.info(f"Received data: {data}")
     if data:
+        errors = option_errors(data)
+        if errors:
+            return jsonify({"error": "; ".join(errors)}), 400
         try:
+            # Serve identical analyses against the same benchmark data from the result cache
+            cache_key = result_cache.request_key(data)
+            cached_task_id = result_cache.lookup(cache_key)
+            if cached_task_id:
+                cached_task = celery.AsyncResult(cached_task_id)
+                if cached_task.state == 'SUCCESS':
+                    logging.info(f"Serving cached result from task: {cached_task_id}")
+                    response = {'task_id': cached_task_id, 'cached': True}
+                    if request.args.get('inline'):
+                        response['result'] = cached_task.result
+                    return jsonify(response), 200
+
             # Enqueue the task using Celery
-            task = process_data.apply_async(args=[data])
+            task = celery.send_task(PROCESS_DATA_TASK, args=[data])
             logging.info(f"Enqueued task: {task.id}")
             return jsonify({'task_id': task.id}), 202  # Return 202 Accepted
         except Exception as e:
@@ -40,24 +98,64 @@ def submit_data():
         logging.error("No data provided in request")
         return jsonify({"error": "No data provided"}), 400
 
+# Route to analyze a lineup of funds against one benchmark and factor set in a single task
+@app.route('/submit-batch', methods=['POST'])
+def submit_batch():
+    data = request.get_json()
+    if not data or not data.get('funds'):
+        logging.error("No funds provided in batch request")
+        return jsonify({"error": "No funds provided"}), 400
+    errors = option_errors(data)
+    if errors:
+        return jsonify({"error": "; ".join(errors)}), 400
+    try:
+        task = celery.send_task(PROCESS_BATCH_TASK, args=[data])
+        logging.info(f"Enqueued batch task for {len(data['funds'])} funds: {task.id}")
+        return jsonify({'task_id': task.id}), 202
+    except Exception as e:
+        logging.error(f"Failed to enqueue batch task: {e}", exc_info=True)
+        return jsonify({"error": "Failed to enqueue task"}), 500
+
 # Route to check the status of a task
 @app.route('/task-status/<task_id>', methods=['GET'])
 def task_status(task_id):
-    task = process_data.AsyncResult(task_id)
+    task = celery.AsyncResult(task_id)
     if task.state == 'PENDING':
         # Task has not started yet
         response = {'status': 'pending'}
     elif task.state == 'SUCCESS':
         # Task completed successfully
         response = {'status': 'completed', 'result': task.result}
+        if request.args.get('encoding') == 'msgpack':
+            # Compact binary form with float32 arrays
+            try:
+                return Response(result_encoding.encode_msgpack(response), mimetype='application/msgpack')
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
     elif task.state == 'FAILURE':
         # Task failed
         response = {'status': 'error', 'error': str(task.info)}
     else:
         # Task is in progress
         response = {'status': task.state}
+        if isinstance(task.info, dict) and 'pieces' in task.info:
+            # Split into subtasks: report which pieces have finished
+            states = {name: celery.AsyncResult(piece_id).state for name, piece_id in task.info['pieces'].items()}
+            response['pieces'] = {
+                'completed': sorted(name for name, state in states.items() if state == 'SUCCESS'),
+                'pending': sorted(name for name, state in states.items() if state != 'SUCCESS')
+            }
     return jsonify(response)
 
+# Route exposing the analysis task counters and histograms to Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    try:
+        return Response(task_metrics.render_metrics(), mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        logging.error(f"Failed to read task metrics: {e}", exc_info=True)
+        return Response("Task metrics unavailable\n", status=503, mimetype='text/plain')
+
 # Serve React App
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
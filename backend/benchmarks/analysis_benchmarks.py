@@ -0,0 +1,229 @@
+# backend/benchmarks/analysis_benchmarks.py
+"""
+Timings of the analysis hot paths on synthetic data.
+
+Times model.run_regression for each model type, simple_calcs.calculate_and_format_rolling,
+cone_chart.create_cone_chart, data_processing.create_return_dfs against a SQLite database of
+the synthetic benchmarks, and a full process_data run executed eagerly, for every history
+length requested. Writes a JSON report. With --compare, each median is compared with a previous
+report and the run fails if any benchmark is slower than --max-slowdown allows.
+
+Benchmark caches, the shared panel, the snapshot and the analysis state are disabled, so every
+run does the full work, and Redis is replaced by an in-memory stub, so no run touches a real
+server or waits on a connection.
+
+Usage:
+    python benchmarks/analysis_benchmarks.py [--months 120 240 480] [--factors 5] [--window 36]
+        [--repeat 3] [--output benchmark_results.json] [--compare previous.json] [--max-slowdown 1.25]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks import synthetic
+
+MODEL_TYPES = ['OLS', 'Ridge', 'Lasso']
+
+
+class MemoryRedis:
+    """The few Redis commands the analysis tasks use, kept in a dict."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def delete(self, key):
+        return int(self.values.pop(key, None) is not None)
+
+    def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+    def hincrbyfloat(self, key, field, amount):
+        fields = self.values.setdefault(key, {})
+        fields[field] = fields.get(field, 0.0) + amount
+        return fields[field]
+
+    def hgetall(self, key):
+        return dict(self.values.get(key, {}))
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+
+def time_call(func, repeat, warmup=1):
+    """Wall-clock seconds of `repeat` calls of `func`, after `warmup` untimed calls."""
+    for _ in range(warmup):
+        func()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def entry(name, months, factors, window, runs):
+    return {
+        'id': f"{name}/{months}m/{factors}f/{window}w",
+        'name': name,
+        'months': months,
+        'factors': factors,
+        'window': window,
+        'runs_s': [round(seconds, 6) for seconds in runs],
+        'median_s': round(statistics.median(runs), 6),
+        'min_s': round(min(runs), 6),
+    }
+
+
+def configure_environment(database_url):
+    # Read by the analysis modules when they are imported
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['BENCHMARK_CACHE_MAX_BYTES'] = '0'
+    os.environ['BENCHMARK_SHARED_PANEL'] = '0'
+    os.environ['ANALYSIS_STATE_TTL_SECONDS'] = '0'
+    os.environ['PROCESS_DATA_MODE'] = 'single'
+    os.environ.pop('BENCHMARK_SNAPSHOT_DIR', None)
+    # Never a developer's real Redis; run_suite swaps the client for MemoryRedis
+    os.environ['REDIS_TLS_URL'] = 'rediss://localhost:6379/0'
+
+
+def stub_redis():
+    from celery_app import celery
+    # Every Redis access goes through data_version.redis_client, which reads this client
+    celery.backend.client = MemoryRedis()
+
+
+def run_suite(months_list, n_factors, window, repeat, seed):
+    """
+    Time every hot path for each history length.
+
+    Returns:
+    - results (list[dict]): One entry per benchmark and history length.
+    """
+    fund, factors = synthetic.make_returns(max(months_list), n_factors, seed)
+    configure_environment(synthetic.write_sqlite(os.path.join(tempfile.mkdtemp(), 'benchmarks.db'), factors))
+
+    stub_redis()
+    from analysis import model, simple_calcs, cone_chart, data_processing, tasks
+    # The analysis modules log every window at DEBUG
+    logging.disable(logging.INFO)
+
+    results = []
+    for months in months_list:
+        request = synthetic.make_request(fund.tail(months), n_factors)
+        fund_return_df, _, _, regression_df = data_processing.create_return_dfs(request)
+        returns = fund_return_df.iloc[:, 0]
+
+        benchmarks = [
+            (f"run_regression/{model_type}", lambda model_type=model_type: model.run_regression(fund_return_df, regression_df, window, model_type, 'Absolute'))
+            for model_type in MODEL_TYPES
+        ]
+        benchmarks += [
+            ('calculate_and_format_rolling', lambda: simple_calcs.calculate_and_format_rolling(fund_return_df, window)),
+            ('create_cone_chart', lambda: cone_chart.create_cone_chart(returns)),
+            ('create_return_dfs', lambda: data_processing.create_return_dfs(request)),
+            # Every time frame and model, executed in this process
+            ('process_data', lambda: tasks.process_data.apply(args=[request]).get()),
+        ]
+        for name, func in benchmarks:
+            result = entry(name, months, n_factors, window, time_call(func, repeat))
+            print(f"{result['id']:<50} {result['median_s'] * 1000:>10.1f} ms", file=sys.stderr)
+            results.append(result)
+    return results
+
+
+def compare(results, baseline, max_slowdown):
+    """
+    Annotate results with their ratio to a previous report's median.
+
+    Returns:
+    - regressions (list[str]): IDs of benchmarks more than max_slowdown times slower.
+    """
+    previous = {result['id']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        if result['id'] not in previous:
+            continue
+        result['baseline_median_s'] = previous[result['id']]['median_s']
+        result['ratio'] = round(result['median_s'] / result['baseline_median_s'], 3)
+        if result['ratio'] > max_slowdown:
+            regressions.append(result['id'])
+    return regressions
+
+
+def git_commit():
+    try:
+        completed = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--months', type=int, nargs='+', default=[120, 240, 480], help="History lengths to benchmark")
+    parser.add_argument('--factors', type=int, default=5)
+    parser.add_argument('--window', type=int, default=36, help="Rolling window of the per-function benchmarks")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="Previous report to compare medians against")
+    parser.add_argument('--max-slowdown', type=float, default=1.25)
+    args = parser.parse_args()
+
+    import numpy as np
+    report = {
+        'benchmark': 'analysis_hot_paths',
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {'months': args.months, 'factors': args.factors, 'window': args.window, 'repeat': args.repeat, 'seed': args.seed},
+        'results': run_suite(args.months, args.factors, args.window, args.repeat, args.seed),
+    }
+
+    passed = True
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report['compared_with'] = {'commit': baseline.get('commit'), 'max_slowdown': args.max_slowdown}
+        report['regressions'] = compare(report['results'], baseline, args.max_slowdown)
+        passed = not report['regressions']
+        for result in report['results']:
+            if 'ratio' in result:
+                print(f"{result['id']:<50} x{result['ratio']:.2f}", file=sys.stderr)
+    report['passed'] = passed
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
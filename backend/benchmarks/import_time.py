@@ -0,0 +1,101 @@
+# backend/benchmarks/import_time.py
+"""
+Startup budget for the web process.
+
+Imports `app` in fresh interpreters and fails if the median import time exceeds the budget, or
+if any of the analysis-only dependencies got imported. Prints a JSON report.
+
+Usage:
+    python benchmarks/import_time.py [--runs 5] [--budget-ms 1000]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only the Celery workers may load these
+WORKER_ONLY_MODULES = ['numpy', 'pandas', 'scipy', 'sklearn', 'statsmodels', 'sqlalchemy', 'aiohttp', 'analysis']
+DEFAULT_BUDGET_MS = float(os.getenv('WEB_IMPORT_BUDGET_MS', 1000))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'modules': sorted({name.split('.')[0] for name in sys.modules})}))
+"""
+
+
+def measure_import(env):
+    """
+    Import `app` once in a new interpreter.
+
+    Returns:
+    - seconds (float): Time spent importing app.
+    - modules (list): Top-level packages loaded by then.
+    - slowest (list): The slowest imports made by app and its direct imports, as
+      (package, cumulative ms), from -X importtime.
+    """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing app failed:\n{completed.stderr[-2000:]}")
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    slowest = []
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", indented two spaces per level
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, package = line.split('|')
+        depth = (len(package) - len(package.lstrip()) - 1) // 2
+        if depth not in (1, 2) or not cumulative.strip().isdigit():
+            continue
+        slowest.append((package.strip(), int(cumulative) / 1000))
+    slowest.sort(key=lambda entry: entry[1], reverse=True)
+    return report['seconds'], report['modules'], slowest[:10]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+
+    # app refuses to import without a broker URL; nothing connects at import time
+    env = dict(os.environ)
+    env.setdefault('REDIS_TLS_URL', 'rediss://localhost:6379/0')
+
+    timings = []
+    try:
+        for _ in range(args.runs):
+            seconds, modules, slowest = measure_import(env)
+            timings.append(seconds * 1000)
+    except RuntimeError as e:
+        print(json.dumps({'benchmark': 'web_import_time', 'error': str(e), 'passed': False}, indent=2))
+        return 1
+
+    median_ms = statistics.median(timings)
+    worker_only = sorted(set(modules) & set(WORKER_ONLY_MODULES))
+    report = {
+        'benchmark': 'web_import_time',
+        'runs_ms': [round(ms, 1) for ms in timings],
+        'median_ms': round(median_ms, 1),
+        'budget_ms': args.budget_ms,
+        'worker_only_modules_loaded': worker_only,
+        'slowest_imports_ms': [[package, round(ms, 1)] for package, ms in slowest],
+        'passed': median_ms <= args.budget_ms and not worker_only,
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if report['passed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
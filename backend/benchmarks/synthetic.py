@@ -0,0 +1,94 @@
+# backend/benchmarks/synthetic.py
+"""
+Deterministic synthetic fund, benchmark and factor returns for the benchmark suite.
+
+Factors load on a common market factor, so they are correlated the way equity indices are, and
+the fund is a noisy combination of the factors. The same seed always gives the same data.
+"""
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, MetaData, Table, Column, String, Date, Float
+
+LAST_MONTH = '2024-12-31'
+
+
+def factor_names(n_factors):
+    return [f"Factor {i + 1}" for i in range(n_factors)]
+
+
+def make_returns(n_months, n_factors, seed=0):
+    """
+    Monthly returns of a fund and its factors.
+
+    Parameters:
+    - n_months (int): History length, ending at LAST_MONTH.
+    - n_factors (int): Number of factors; the first one doubles as the benchmark.
+    - seed (int): Random seed.
+
+    Returns:
+    - fund (pd.Series): Fund returns.
+    - factors (pd.DataFrame): Factor returns, one column per factor.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=LAST_MONTH, periods=n_months, freq='ME', name='date')
+    market = rng.normal(0.006, 0.045, n_months)
+    betas = np.concatenate(([1.0], rng.uniform(0.3, 1.2, n_factors - 1)))
+    factors = market[:, None] * betas + rng.normal(0.001, 0.02, (n_months, n_factors))
+    exposures = rng.normal(0.6, 0.3, n_factors) / n_factors
+    fund = factors @ exposures + rng.normal(0.0005, 0.01, n_months)
+    return (
+        pd.Series(fund, index=dates, name='Fund'),
+        pd.DataFrame(factors, index=dates, columns=factor_names(n_factors))
+    )
+
+
+def make_request(fund, n_factors):
+    """
+    /submit-data payload for the synthetic fund: the first factor is the benchmark, and every
+    other factor is residualized against it.
+    """
+    names = factor_names(n_factors)
+    return {
+        'fund': {
+            'description': 'Synthetic Fund',
+            'pastedData': [
+                {'id': i, 'date': date.strftime('%Y-%m-%d'), 'return': str(value)}
+                for i, (date, value) in enumerate(fund.items())
+            ]
+        },
+        'benchmark': {'source': names[0], 'description': 'Synthetic Benchmark'},
+        'residual_return_streams': [
+            {'source': name, 'description': name, 'residualization': [] if i == 0 else [names[0]]}
+            for i, name in enumerate(names)
+        ]
+    }
+
+
+def write_sqlite(path, factors):
+    """
+    Store the factor returns in a SQLite benchmark_returns table shaped like the collector's.
+
+    Returns:
+    - url (str): Database URL of the file.
+    """
+    url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    metadata = MetaData()
+    table = Table(
+        'benchmark_returns', metadata,
+        Column('benchmark_name', String, primary_key=True),
+        Column('date', Date, primary_key=True),
+        Column('return_rate', Float)
+    )
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    rows = [
+        {'benchmark_name': name, 'date': date.date(), 'return_rate': float(value)}
+        for name in factors.columns
+        for date, value in factors[name].items()
+    ]
+    with engine.begin() as conn:
+        conn.execute(table.insert(), rows)
+    engine.dispose()
+    return url
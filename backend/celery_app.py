@@ -18,6 +18,8 @@ multiprocessing.set_start_method('spawn', force=True)
 # Append the backend directory to sys.path to ensure modules are discoverable
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+import result_encoding
+
 # Get Redis TLS URL from environment variables
 redis_tls_url = os.getenv('REDIS_TLS_URL')
 
@@ -28,11 +30,15 @@ if not redis_tls_url:
 # Initialize Celery with Redis TLS URL for both broker and result backend
 celery = Celery('tasks', broker=redis_tls_url, backend=redis_tls_url)
 
+# Analysis results, and the chord callback arguments built from them, hold NumPy arrays;
+# encode them with the single-pass result encoder
+result_encoding.register_celery_serializer()
+
 # Celery configuration with SSL options for Redis
 celery.conf.update(
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    task_serializer=result_encoding.CELERY_SERIALIZER,
+    accept_content=['json', result_encoding.CELERY_SERIALIZER],
+    result_serializer=result_encoding.CELERY_SERIALIZER,
     timezone='UTC',
     enable_utc=True,
     broker_use_ssl={
@@ -1,14 +1,17 @@
-import http.client
 import json
 import aiohttp
 import asyncio
+import math
+import sys
 import pandas as pd
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Optional
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
 import os
-from sqlalchemy import create_engine, Column, String, Date, Float, PrimaryKeyConstraint, text
-from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy import create_engine, Column, String, Date, Float, PrimaryKeyConstraint
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import SQLAlchemyError
 
 # Load API key from .env file
@@ -36,111 +39,270 @@ if uri and uri.startswith("postgres://"):
     uri = uri.replace("postgres://", "postgresql://")
 engine = create_engine(uri)
 Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+
+# Rows per upsert statement, and fetched benchmarks that may wait for the writer at once
+UPSERT_BATCH_SIZE = int(os.getenv('BENCHMARK_UPSERT_BATCH_SIZE', 5000))
+WRITE_QUEUE_SIZE = int(os.getenv('BENCHMARK_WRITE_QUEUE_SIZE', 100))
 
 # API setup
 BASE_URL = 'https://client-api.caissallc.com'
+TOKEN_URL = os.getenv('API_TOKEN_URL', 'https://platform-login.caissallc.com/connect/token')
+
+# Tokens are renewed this long before they expire; the lifetime is assumed when the response omits it
+TOKEN_REFRESH_MARGIN_SECONDS = 120
+DEFAULT_TOKEN_LIFETIME_SECONDS = 3600
+
+# Upper bound on concurrent API requests; the rate limiter lowers it while the API throttles us
+MAX_CONCURRENT_REQUESTS = int(os.getenv('API_MAX_CONCURRENT_REQUESTS', 50))
+
+# Page size when fetching only the months after the latest stored one, newest first
+INCREMENTAL_PAGE_SIZE = int(os.getenv('BENCHMARK_INCREMENTAL_PAGE_SIZE', 24))
+
+# Concurrency limit shared by every API request, adjusted AIMD-style: each success raises it by
+# about one request per round trip, and a throttled response halves it and pauses every request
+# until Retry-After has passed. 429s to requests sent before the pause count as the same event.
+# Use as `async with limiter:` around each request, then report succeeded() or throttled().
+class AdaptiveRateLimiter:
+    def __init__(self, max_concurrency=50, min_concurrency=1, decrease_factor=0.5):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.decrease_factor = decrease_factor
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._decreased_until = 0.0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    async def acquire(self):
+        # Waits for a free slot and for any pause to end
+        loop = asyncio.get_running_loop()
+        async with self._condition:
+            while True:
+                pause = self.paused_until - loop.time()
+                if pause <= 0 and self.in_flight < max(int(self.limit), self.min_concurrency):
+                    break
+                try:
+                    await asyncio.wait_for(self._condition.wait(), pause if pause > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def succeeded(self):
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def throttled(self, retry_after: float):
+        # `retry_after` is how long every request should wait before the next attempt
+        now = asyncio.get_running_loop().time()
+        self.paused_until = max(self.paused_until, now + retry_after)
+        if now >= self._decreased_until:
+            self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+            self._decreased_until = self.paused_until
+            print(f"Rate limited. Pausing requests for {retry_after:.1f} seconds; concurrency limit {int(self.limit)}")
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Seconds to wait from a Retry-After header given as seconds or an HTTP date; None if missing or malformed
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return max(seconds, 0.0) if math.isfinite(seconds) else None
 
 class APIAsyncClient:
-    def __init__(self, session: aiohttp.ClientSession):
+    def __init__(self, session: aiohttp.ClientSession, rate_limiter: Optional[AdaptiveRateLimiter] = None):
         self.session = session
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter(max_concurrency=MAX_CONCURRENT_REQUESTS)
         self.bearer_token = None
+        self.token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
 
     async def _get_bearer_token(self):
-        conn = http.client.HTTPSConnection("platform-login.caissallc.com")
-        payload = f'grant_type=password&username={API_USERNAME}&password={API_PASSWORD}&scope=offline_access%20read'
-        headers = {
-            'Authorization': f'Basic {API_KEY}',
-            'Content-Type': 'application/x-www-form-urlencoded'
+        # Requests a new token on the shared session, without blocking the event loop
+        payload = {
+            'grant_type': 'password',
+            'username': API_USERNAME,
+            'password': API_PASSWORD,
+            'scope': 'offline_access read'
         }
-        conn.request("POST", "/connect/token", payload, headers)
-        res = conn.getresponse()
-        data = res.read()
-        token_data = json.loads(data.decode("utf-8"))
+        headers = {'Authorization': f'Basic {API_KEY}'}
+        async with self.session.post(TOKEN_URL, data=payload, headers=headers) as response:
+            response.raise_for_status()
+            token_data = await response.json(content_type=None)
         self.bearer_token = token_data.get("access_token")
-        conn.close()
-
-    async def _fetch_with_retry(self, url: str, max_retries: int = 5, backoff_factor: int = 1) -> List[Dict[str, Any]]:
-        headers = {'Authorization': f'Bearer {self.bearer_token}'}
-        aggregated_results = []
-        page_index = 1
-        total_size = None
-
-        while total_size is None or len(aggregated_results) < total_size:
-            page_url = f"{url}&pageIndex={page_index}"
-            for retry in range(max_retries):
-                try:
+        lifetime = float(token_data.get("expires_in") or DEFAULT_TOKEN_LIFETIME_SECONDS)
+        self.token_expires_at = asyncio.get_running_loop().time() + lifetime
+
+    async def _valid_token(self) -> str:
+        # Current token, renewed shortly before it expires; one request refreshes while the rest wait
+        if self.bearer_token is None or asyncio.get_running_loop().time() >= self.token_expires_at - TOKEN_REFRESH_MARGIN_SECONDS:
+            async with self._token_lock:
+                if self.bearer_token is None or asyncio.get_running_loop().time() >= self.token_expires_at - TOKEN_REFRESH_MARGIN_SECONDS:
+                    await self._get_bearer_token()
+        return self.bearer_token
+
+    async def _refresh_rejected_token(self, rejected_token: str):
+        # Called on a 401: only the first request rejected with a given token fetches a new one
+        async with self._token_lock:
+            if self.bearer_token == rejected_token:
+                print("Bearer token rejected. Refreshing...")
+                await self._get_bearer_token()
+
+    async def _fetch_page(self, page_url: str, max_retries: int = 5, backoff_factor: int = 1) -> Dict[str, Any]:
+        # One page, through the shared rate limiter; 429s pause every request, not just this one
+        for retry in range(max_retries):
+            token = await self._valid_token()
+            headers = {'Authorization': f'Bearer {token}'}
+            try:
+                async with self.rate_limiter:
                     async with self.session.get(page_url, headers=headers) as response:
+                        if response.status == 429:
+                            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                            self.rate_limiter.throttled(retry_after if retry_after is not None else backoff_factor * (2 ** retry))
+                            continue
                         response.raise_for_status()
                         data = await response.json()
-                        if 'results' in data:
-                            aggregated_results.extend(data['results'])
-                        if 'paging' in data:
-                            total_size = data['paging'].get('totalSize', total_size)
-                            page_index += 1
-                        break  # Exit retry loop on success
-                except aiohttp.ClientResponseError as e:
-                    if e.status == 429:
-                        sleep_time = backoff_factor * (2 ** retry)
-                        print(f"Rate limited. Retrying in {sleep_time} seconds...")
-                        await asyncio.sleep(sleep_time)
-                    else:
-                        print(f"HTTP error {e.status} for URL: {page_url}")
-                        raise e
-                except aiohttp.ClientError as e:
-                    print(f"Client error: {e}. Retrying...")
-                    await asyncio.sleep(backoff_factor * (2 ** retry))
-            else:
-                print(f"Failed to fetch {page_url} after {max_retries} retries.")
-                raise Exception(f"Max retries exceeded for URL: {page_url}")
-
+                        self.rate_limiter.succeeded()
+                        return data
+            except aiohttp.ClientResponseError as e:
+                if e.status == 401:
+                    await self._refresh_rejected_token(token)
+                else:
+                    print(f"HTTP error {e.status} for URL: {page_url}")
+                    raise e
+            except aiohttp.ClientError as e:
+                print(f"Client error: {e}. Retrying...")
+                await asyncio.sleep(backoff_factor * (2 ** retry))
+
+        print(f"Failed to fetch {page_url} after {max_retries} retries.")
+        raise Exception(f"Max retries exceeded for URL: {page_url}")
+
+    async def _fetch_with_retry(self, url: str, max_retries: int = 5, backoff_factor: int = 1,
+                                stop: Optional[Callable[[List[Dict[str, Any]]], bool]] = None) -> List[Dict[str, Any]]:
+        # `stop` is called with each page's results; returning True ends paging early.
+        # Without it, the pages after the first are fetched concurrently once the total size is known.
+        first_page = await self._fetch_page(f"{url}&pageIndex=1", max_retries, backoff_factor)
+        aggregated_results = list(first_page.get('results', []))
+        total_size = first_page.get('paging', {}).get('totalSize')
+        page_size = len(aggregated_results)
+        if total_size is None or page_size == 0 or page_size >= total_size:
+            return aggregated_results
+        if stop is not None and stop(aggregated_results):
+            return aggregated_results
+
+        if stop is None:
+            pages = await asyncio.gather(*[
+                self._fetch_page(f"{url}&pageIndex={page_index}", max_retries, backoff_factor)
+                for page_index in range(2, math.ceil(total_size / page_size) + 1)
+            ])
+            for page in pages:
+                aggregated_results.extend(page.get('results', []))
+            return aggregated_results
+
+        page_index = 2
+        while len(aggregated_results) < total_size:
+            page = await self._fetch_page(f"{url}&pageIndex={page_index}", max_retries, backoff_factor)
+            results = page.get('results', [])
+            aggregated_results.extend(results)
+            if not results or stop(results):
+                break
+            page_index += 1
         return aggregated_results
 
     async def fetch_benchmark_ids(self) -> List[Dict[str, Any]]:
         url = f'{BASE_URL}/v0/benchmarks/standard?sortBy=BenchmarkName&sortOrder=Asc&pageSize=6000'
         return await self._fetch_with_retry(url)
 
-    async def fetch_benchmark_returns(self, benchmark_id: int) -> List[Dict[str, Any]]:
-        url = f'{BASE_URL}/v0/benchmarks/returns?sortBy=Date&benchmark.type=Benchmark&benchmark.id={str(benchmark_id)}&periodicity=Monthly&pageSize=1000'
-        return await self._fetch_with_retry(url)
+    async def fetch_benchmark_returns(self, benchmark_id: int, since: Optional[pd.Timestamp] = None) -> List[Dict[str, Any]]:
+        if since is None:
+            url = f'{BASE_URL}/v0/benchmarks/returns?sortBy=Date&benchmark.type=Benchmark&benchmark.id={str(benchmark_id)}&periodicity=Monthly&pageSize=1000'
+            return await self._fetch_with_retry(url)
+
+        # Newest months first, stopping at the first page that reaches back to `since`
+        url = f'{BASE_URL}/v0/benchmarks/returns?sortBy=Date&sortOrder=Desc&benchmark.type=Benchmark&benchmark.id={str(benchmark_id)}&periodicity=Monthly&pageSize={INCREMENTAL_PAGE_SIZE}'
+        return await self._fetch_with_retry(url, stop=lambda page: reaches_date(page, since))
+
+def reaches_date(page: List[Dict[str, Any]], since: pd.Timestamp) -> bool:
+    dates = pd.to_datetime([item['date'] for item in page if 'date' in item]).tz_localize(None)
+    return len(dates) == 0 or dates.min() <= since
+
+def get_latest_stored_dates() -> Dict[str, pd.Timestamp]:
+    # Latest stored month per benchmark, in one query
+    df = execute_query_as_dataframe("SELECT benchmark_name, MAX(date) AS max_date FROM benchmark_returns GROUP BY benchmark_name")
+    return dict(zip(df['benchmark_name'], pd.to_datetime(df['max_date'])))
+
+def upsert_statement():
+    # INSERT ... ON CONFLICT DO UPDATE in the engine's own dialect
+    if engine.dialect.name == 'postgresql':
+        statement = postgresql.insert(BenchmarkReturn)
+    elif engine.dialect.name == 'sqlite':
+        statement = sqlite.insert(BenchmarkReturn)
+    else:
+        raise Exception(f"Upserts are not supported for the {engine.dialect.name} dialect")
+    return statement.on_conflict_do_update(
+        index_elements=['benchmark_name', 'date'],
+        set_={'return_rate': statement.excluded.return_rate}
+    )
 
-def save_to_database(df: pd.DataFrame):
-    df['date'] = pd.to_datetime(df['date']).dt.tz_localize(None)
-    df = df.rename(columns={"returnRate": "return_rate"})
-
-    # Prepare data for bulk insert
-    records = df.to_dict(orient='records')
-    insert_mappings = [
-        {
-            'benchmark_name': record['benchmark_name'],
-            'date': record['date'],
-            'return_rate': record['return_rate']
-        }
-        for record in records
+def to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    # Rows of a fetched returns DataFrame as benchmark_returns insert parameters
+    return [
+        {'benchmark_name': name, 'date': date, 'return_rate': return_rate}
+        for name, date, return_rate in zip(
+            df['benchmark_name'],
+            pd.to_datetime(df['date']).dt.tz_localize(None).dt.date,
+            df['returnRate'].astype(float)
+        )
     ]
 
+def upsert_records(records: List[Dict[str, Any]]) -> int:
+    # Upsert one batch as an executemany, so statement size stays bounded by the batch
     try:
         with engine.begin() as conn:
-            conn.execute(
-                insert(BenchmarkReturn)
-                .values(insert_mappings)
-                .on_conflict_do_update(
-                    index_elements=['benchmark_name', 'date'],
-                    set_=dict(return_rate=text('excluded.return_rate'))
-                )
-            )
-        if not df.empty:
-            print(f'Uploaded {len(df)} rows of returns to the database for {len(df['benchmark_name'].unique())} benchmarks')
+            conn.execute(upsert_statement(), records)
+        return len(records)
     except SQLAlchemyError as e:
-        print(f'Database error: {e}\nDataframe: {df}')
+        print(f'Database error: {e}\nBatch of {len(records)} rows from {records[0]["benchmark_name"]} to {records[-1]["benchmark_name"]}')
+        return 0
+
+async def write_returns(queue: asyncio.Queue) -> int:
+    # Drains fetched DataFrames from `queue` until a None arrives, upserting full batches
+    # in a worker thread while fetching carries on. Returns the number of rows written.
+    pending = []
+    uploaded = 0
+    while True:
+        return_df = await queue.get()
+        if return_df is not None:
+            pending.extend(to_records(return_df))
+        while len(pending) >= UPSERT_BATCH_SIZE or (return_df is None and pending):
+            batch, pending = pending[:UPSERT_BATCH_SIZE], pending[UPSERT_BATCH_SIZE:]
+            uploaded += await asyncio.to_thread(upsert_records, batch)
+        if return_df is None:
+            return uploaded
 
 def get_most_recent_month_end():
-    today = pd.Timestamp.today()
+    today = pd.Timestamp.today().normalize()
     first_day_of_this_month = today.replace(day=1)
     most_recent_month_end = first_day_of_this_month - pd.Timedelta(days=1)
     return most_recent_month_end.tz_localize(None)
 
-async def main():
+async def main(full_refresh: bool = False):
+    # Without full_refresh, benchmarks already in the database only fetch months after their latest stored one
     # Initialize a single aiohttp session
     timeout = aiohttp.ClientTimeout(total=60)  # Adjust timeout as needed
     async with aiohttp.ClientSession(timeout=timeout) as session:
@@ -158,26 +320,45 @@ async def main():
 
         most_recent_month_end = get_most_recent_month_end()
 
-        # Define concurrency level
-        concurrency = 50  # Adjust based on API rate limits
+        latest_stored_dates = {} if full_refresh else get_latest_stored_dates()
+        up_to_date = filtered_benchmarks_df['benchmarkName'].map(
+            lambda name: name in latest_stored_dates and latest_stored_dates[name] >= most_recent_month_end
+        )
+        filtered_benchmarks_df = filtered_benchmarks_df[~up_to_date]
+        print(f"Skipping {int(up_to_date.sum())} up-to-date benchmarks; fetching {len(filtered_benchmarks_df)}")
+
+        # Benchmarks in progress at once; the client's rate limiter governs the requests themselves
+        concurrency = 50
         semaphore = asyncio.Semaphore(concurrency)
 
+        # Completed fetches stream to a single writer through a bounded queue, so memory use
+        # does not grow with the number of benchmarks
+        write_queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+        writer = asyncio.create_task(write_returns(write_queue))
+
         async def fetch_and_process(row):
             async with semaphore:
                 try:
-                    returns = await client.fetch_benchmark_returns(row.id)
+                    # New benchmarks get their full history
+                    since = latest_stored_dates.get(row.benchmarkName)
+                    returns = await client.fetch_benchmark_returns(row.id, since)
                     return_df = pd.DataFrame(returns)
                     if return_df.empty:
-                        return None
+                        return
                     return_df['benchmark_name'] = row.benchmarkName
                     return_df['date'] = pd.to_datetime(return_df['date']).dt.tz_localize(None)
                     return_df = return_df[(return_df['returnRate'] != 0) & pd.notna(return_df['returnRate'])]
                     return_df = return_df[return_df['date'] <= most_recent_month_end]
+                    if since is not None:
+                        return_df = return_df[return_df['date'] > since]
+                    if return_df.empty:
+                        return
                     print(f"{(row.benchmarkName[:30]).ljust(30)}: {return_df['date'].min().strftime('%Y-%m-%d')} --> {return_df['date'].max().strftime('%Y-%m-%d')}")
-                    return return_df
                 except Exception as e:
                     print(f"Error fetching returns for benchmark {row.id}: {e}")
-                    return None
+                    return
+                # Waits while the queue is full, which holds back further fetches
+                await write_queue.put(return_df)
 
         # Create tasks for concurrent execution
         tasks = [
@@ -185,30 +366,32 @@ async def main():
             for row in filtered_benchmarks_df.itertuples(index=False)
         ]
 
-        # Gather results with concurrency
-        results = await asyncio.gather(*tasks)
+        # Fetch with concurrency; the writer only finishes early if it failed
+        fetches = asyncio.gather(*tasks)
+        await asyncio.wait([fetches, writer], return_when=asyncio.FIRST_COMPLETED)
+        if writer.done():
+            fetches.cancel()
+            writer.result()
+            raise Exception("Benchmark return writer stopped before fetching finished")
 
-        # Concatenate all DataFrames, excluding None
-        combined_df = pd.concat([df for df in results if df is not None], ignore_index=True)
+        await write_queue.put(None)
+        uploaded = await writer
+        print(f"Uploaded {uploaded} rows of returns to the database")
+        save_metadata_to_json()
 
-        print("Saving to database...")
-        save_to_database(combined_df)
-        save_metadata_to_json(combined_df)
-        
 
 def execute_query_as_dataframe(query: str) -> pd.DataFrame:
     with engine.connect() as connection:
         df = pd.read_sql_query(query, connection)
     return df
 
-def save_metadata_to_json(df):
-    df['date'] = pd.to_datetime(df['date'])
-
-    # Group by 'benchmark_name' and get the min and max date for each benchmark
-    result_df = df.groupby('benchmark_name').agg(
-        min_date=('date', 'min'),
-        max_date=('date', 'max')
-    ).reset_index()
+def save_metadata_to_json():
+    # Min and max date for each benchmark, from the database since a run may fetch only recent months
+    result_df = execute_query_as_dataframe(
+        "SELECT benchmark_name, MIN(date) AS min_date, MAX(date) AS max_date FROM benchmark_returns GROUP BY benchmark_name ORDER BY benchmark_name"
+    )
+    result_df['min_date'] = pd.to_datetime(result_df['min_date'])
+    result_df['max_date'] = pd.to_datetime(result_df['max_date'])
 
     # Convert the min and max dates to the 'YYYY-MM-DD' format
     result_df['min_date'] = result_df['min_date'].dt.strftime('%Y-%m-%d')
@@ -227,5 +410,5 @@ def save_metadata_to_json(df):
 
 if __name__ == "__main__":
     print('Starting benchmark return upload...')
-    asyncio.run(main())
+    asyncio.run(main(full_refresh='--full' in sys.argv))
     print('Finished uploading benchmark returns')
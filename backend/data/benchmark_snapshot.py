@@ -0,0 +1,209 @@
+# backend/data/benchmark_snapshot.py
+
+import os
+import json
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Snapshot layout: <directory>/CURRENT names the active version directory, which holds
+#   returns.npy  float64 (n_benchmarks, n_months), NaN where a benchmark has no return
+#   dates.npy    datetime64 month ends, ascending
+#   names.json   benchmark names in row order
+#   data_version the benchmark data version the snapshot was written for
+# Each benchmark's history is one contiguous row, so reading it from the memory map is a view.
+CURRENT_FILE = 'CURRENT'
+RETURNS_FILE = 'returns.npy'
+DATES_FILE = 'dates.npy'
+NAMES_FILE = 'names.json'
+DATA_VERSION_FILE = 'data_version'
+
+_snapshot = None
+
+
+def snapshot_directory():
+    """Directory of the local benchmark snapshot (BENCHMARK_SNAPSHOT_DIR), or None if disabled."""
+    return os.getenv('BENCHMARK_SNAPSHOT_DIR') or None
+
+
+class BenchmarkPanel:
+    """
+    Read-only wide panel of benchmark returns: `returns` has one row per benchmark and one
+    column per month in `dates`, and `rows` maps benchmark names to rows.
+    """
+
+    def __init__(self, names, dates, returns):
+        self.rows = {name: row for row, name in enumerate(names)}
+        self.dates = pd.DatetimeIndex(dates, name='date')
+        self.returns = returns
+
+    def __contains__(self, benchmark_name):
+        return benchmark_name in self.rows
+
+    def series(self, benchmark_name):
+        """Full history of one benchmark as a view of the memory map, including missing months."""
+        return self.returns[self.rows[benchmark_name]]
+
+    def frame(self, benchmark_names, start_date=None, end_date=None):
+        """
+        Returns of the given benchmarks between two dates, one column per benchmark.
+
+        Like the database query, months in which none of the benchmarks has a return are left out.
+
+        Parameters:
+        - benchmark_names (list): Benchmarks to read; all must be in the snapshot.
+        - start_date, end_date: Optional inclusive date bounds.
+
+        Returns:
+        - panel (pd.DataFrame): Date-indexed returns.
+        """
+        start = 0 if start_date is None else self.dates.searchsorted(pd.Timestamp(start_date), side='left')
+        end = len(self.dates) if end_date is None else self.dates.searchsorted(pd.Timestamp(end_date), side='right')
+        values = np.empty((max(end - start, 0), len(benchmark_names)))
+        for column, name in enumerate(benchmark_names):
+            values[:, column] = self.series(name)[start:end]
+        observed = ~np.isnan(values).all(axis=1)
+        return pd.DataFrame(values[observed], index=self.dates[start:end][observed], columns=list(benchmark_names))
+
+
+class BenchmarkSnapshot(BenchmarkPanel):
+    """
+    Benchmark panel memory-mapped from a snapshot version directory.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, NAMES_FILE)) as f:
+            names = json.load(f)
+        try:
+            with open(os.path.join(path, DATA_VERSION_FILE)) as f:
+                self.data_version = f.read().strip()
+        except FileNotFoundError:
+            self.data_version = None
+        super().__init__(
+            names,
+            np.load(os.path.join(path, DATES_FILE)),
+            np.load(os.path.join(path, RETURNS_FILE), mmap_mode='r')
+        )
+        self.path = path
+
+
+def load_snapshot(data_version, directory=None):
+    """
+    The current snapshot in `directory`, reopened whenever a new version is published.
+
+    Only hosts that ran the upload rewrite their snapshot, so one written for another
+    benchmark data version than `data_version` is stale and is not served.
+
+    Returns None when snapshots are disabled, none has been written yet, or the current one
+    does not match `data_version` (including when the version is unknown).
+    """
+    global _snapshot
+    directory = directory or snapshot_directory()
+    if directory is None or data_version is None:
+        return None
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            path = os.path.join(directory, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+    snapshot = _snapshot
+    if snapshot is None or snapshot.path != path:
+        try:
+            snapshot = BenchmarkSnapshot(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not open benchmark snapshot {path}: {e}")
+            return None
+        _snapshot = snapshot
+    if snapshot.data_version != str(data_version):
+        return None
+    return snapshot
+
+
+def panel_layout(engine):
+    """
+    Benchmark names, sorted, and every month end from the first to the last stored return.
+    """
+    names = pd.read_sql_query(
+        "SELECT DISTINCT benchmark_name FROM benchmark_returns ORDER BY benchmark_name", engine
+    )['benchmark_name'].tolist()
+    if not names:
+        return names, pd.DatetimeIndex([], name='date')
+    bounds = pd.read_sql_query("SELECT MIN(date) AS min_date, MAX(date) AS max_date FROM benchmark_returns", engine)
+    dates = pd.date_range(
+        pd.Timestamp(bounds['min_date'].iloc[0]) + pd.offsets.MonthEnd(0),
+        pd.Timestamp(bounds['max_date'].iloc[0]) + pd.offsets.MonthEnd(0),
+        freq='ME'
+    )
+    return names, dates
+
+
+def fill_panel(engine, names, dates, returns, chunksize=500_000):
+    """
+    Stream benchmark_returns into `returns`, shape (len(names), len(dates)), in chunks.
+    Months without a return are NaN.
+    """
+    rows = {name: row for row, name in enumerate(names)}
+    returns[:] = np.nan
+    with engine.connect().execution_options(stream_results=True) as conn:
+        for chunk in pd.read_sql_query("SELECT benchmark_name, date, return_rate FROM benchmark_returns", conn, chunksize=chunksize):
+            row_index = chunk['benchmark_name'].map(rows)
+            column_index = dates.get_indexer(pd.to_datetime(chunk['date']) + pd.offsets.MonthEnd(0))
+            # Skip rows written after the layout was read
+            known = row_index.notna().to_numpy() & (column_index >= 0)
+            returns[row_index.to_numpy()[known].astype(int), column_index[known]] = chunk['return_rate'].to_numpy(dtype=float)[known]
+
+
+def write_snapshot(engine, directory, data_version, chunksize=500_000):
+    """
+    Write benchmark_returns to a new snapshot version and publish it.
+
+    Rows are streamed from the database in chunks straight into the memory-mapped panel, so
+    memory use does not depend on the size of the table. Versions older than the previous
+    one are removed.
+
+    Parameters:
+    - engine: SQLAlchemy engine of the benchmark database.
+    - directory (str): Snapshot directory.
+    - data_version (str): Benchmark data version the database is at, recorded with the snapshot.
+    - chunksize (int): Rows read per chunk.
+
+    Returns:
+    - path (str): The new version directory, or None if benchmark_returns is empty.
+    """
+    names, dates = panel_layout(engine)
+    if not names:
+        return None
+
+    version = pd.Timestamp.now(tz='UTC').strftime('%Y%m%dT%H%M%S%f')
+    path = os.path.join(directory, version)
+    os.makedirs(path)
+    returns = np.lib.format.open_memmap(os.path.join(path, RETURNS_FILE), mode='w+', dtype='<f8', shape=(len(names), len(dates)))
+    fill_panel(engine, names, dates, returns, chunksize)
+    returns.flush()
+    del returns
+    np.save(os.path.join(path, DATES_FILE), dates.values)
+    with open(os.path.join(path, NAMES_FILE), 'w') as f:
+        json.dump(names, f)
+    with open(os.path.join(path, DATA_VERSION_FILE), 'w') as f:
+        f.write(str(data_version))
+
+    # Readers switch over when CURRENT is replaced; os.replace is atomic
+    current_file = os.path.join(directory, CURRENT_FILE)
+    previous = None
+    if os.path.exists(current_file):
+        with open(current_file) as f:
+            previous = f.read().strip()
+    with open(current_file + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(current_file + '.tmp', current_file)
+
+    for entry in os.listdir(directory):
+        if entry not in (version, previous, CURRENT_FILE) and os.path.isdir(os.path.join(directory, entry)):
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+    logger.info(f"Wrote benchmark snapshot {path}: {len(names)} benchmarks x {len(dates)} months")
+    return path
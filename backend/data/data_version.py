@@ -0,0 +1,37 @@
+# backend/data/data_version.py
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Redis key bumped every time benchmark_returns is reloaded, so caches know to refresh
+BENCHMARK_DATA_VERSION_KEY = 'benchmark_returns:data_version'
+
+
+def redis_client():
+    """
+    Redis client of the Celery result backend, shared by the caches and metrics kept in Redis.
+
+    Imported lazily so modules that only read the version do not require a broker at import time.
+    """
+    from celery_app import celery
+    return celery.backend.client
+
+
+def get_benchmark_data_version():
+    """
+    Current benchmark data version, or None if it cannot be read.
+    """
+    try:
+        value = redis_client().get(BENCHMARK_DATA_VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"Could not read benchmark data version: {e}")
+        return None
+    return value.decode() if value is not None else '0'
+
+
+def bump_benchmark_data_version():
+    """
+    Mark benchmark_returns as changed. Returns the new version.
+    """
+    return str(redis_client().incr(BENCHMARK_DATA_VERSION_KEY))
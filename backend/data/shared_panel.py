@@ -0,0 +1,182 @@
+# backend/data/shared_panel.py
+
+import os
+import json
+import time
+import logging
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+from .benchmark_snapshot import BenchmarkPanel, load_snapshot, panel_layout, fill_panel
+from .data_version import get_benchmark_data_version
+
+logger = logging.getLogger(__name__)
+
+# Block layout: int64 header (ready flag, benchmarks, months, name bytes, date unit), the
+# JSON-encoded names padded to 8 bytes, int64 month-end dates, then float64 returns with
+# one row per benchmark. One block per benchmark data version, named after it.
+_HEADER_LENGTH = 5
+_DATE_UNITS = ['s', 'ms', 'us', 'ns']
+READY_TIMEOUT_SECONDS = 120
+# Where POSIX shared memory blocks are listed on Linux
+SHM_DIRECTORY = '/dev/shm'
+
+_attached = None
+_lock = threading.Lock()
+
+
+def shared_panel_enabled():
+    """Whether worker processes share one benchmark panel per host (BENCHMARK_SHARED_PANEL=1)."""
+    return os.getenv('BENCHMARK_SHARED_PANEL', '0') == '1'
+
+
+def block_name(data_version):
+    return f"{os.getenv('BENCHMARK_SHARED_PANEL_NAME', 'rba_benchmarks')}_{data_version}"
+
+
+class SharedBenchmarkPanel(BenchmarkPanel):
+    """
+    Benchmark panel backed by a shared memory block, read-only and without copying.
+    """
+
+    def __init__(self, shm, data_version):
+        header = np.ndarray((_HEADER_LENGTH,), dtype=np.int64, buffer=shm.buf)
+        n_benchmarks, n_dates, names_nbytes, unit = (int(value) for value in header[1:])
+        offset = 8 * _HEADER_LENGTH
+        names = json.loads(bytes(shm.buf[offset:offset + names_nbytes]).decode('utf-8'))
+        offset += _padded(names_nbytes)
+        dates = np.ndarray((n_dates,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += 8 * n_dates
+        returns = np.ndarray((n_benchmarks, n_dates), dtype=np.float64, buffer=shm.buf, offset=offset)
+        returns.flags.writeable = False
+
+        super().__init__(names, dates.view(f'datetime64[{_DATE_UNITS[unit]}]'), returns)
+        self.data_version = data_version
+        # Assigned last so the arrays above are released before the block is closed
+        self.shm = shm
+
+
+def _padded(nbytes):
+    return -(-nbytes // 8) * 8
+
+
+def publish_panel(data_version, engine):
+    """
+    Load every benchmark into a new shared block for `data_version`.
+
+    The panel is read from the local snapshot when there is one for `data_version`, otherwise
+    from the database.
+    If another process on the host has already created the block, it is attached instead.
+    The blocks of earlier versions are unlinked; processes still attached to them keep
+    their mapping until they move on.
+
+    Returns:
+    - panel (SharedBenchmarkPanel): The published panel.
+    """
+    snapshot = load_snapshot(data_version)
+    if snapshot is not None:
+        names, dates = list(snapshot.rows), snapshot.dates
+    else:
+        names, dates = panel_layout(engine)
+
+    names_bytes = json.dumps(names).encode('utf-8')
+    size = 8 * _HEADER_LENGTH + _padded(len(names_bytes)) + 8 * len(dates) * (1 + len(names))
+    try:
+        shm = shared_memory.SharedMemory(name=block_name(data_version), create=True, size=max(size, 1))
+    except FileExistsError:
+        return attach_panel(data_version)
+
+    unit = np.datetime_data(dates.values.dtype)[0]
+    header = np.ndarray((_HEADER_LENGTH,), dtype=np.int64, buffer=shm.buf)
+    header[1:] = [len(names), len(dates), len(names_bytes), _DATE_UNITS.index(unit)]
+    offset = 8 * _HEADER_LENGTH
+    shm.buf[offset:offset + len(names_bytes)] = names_bytes
+    offset += _padded(len(names_bytes))
+    np.ndarray((len(dates),), dtype=np.int64, buffer=shm.buf, offset=offset)[:] = dates.values.view(np.int64)
+    offset += 8 * len(dates)
+    returns = np.ndarray((len(names), len(dates)), dtype=np.float64, buffer=shm.buf, offset=offset)
+    if snapshot is not None:
+        returns[:] = snapshot.returns
+    else:
+        fill_panel(engine, names, dates, returns)
+    del returns
+    # Readers wait for this flag, so it is set once everything else is written
+    header[0] = 1
+    del header
+
+    _unlink_stale_blocks(data_version)
+    logger.info(f"Published shared benchmark panel {shm.name}: {len(names)} benchmarks x {len(dates)} months")
+    return SharedBenchmarkPanel(shm, data_version)
+
+
+def attach_panel(data_version):
+    """
+    Attach to the shared block of `data_version`, waiting for its publisher to finish.
+
+    Raises FileNotFoundError if no process has created it.
+    """
+    shm = shared_memory.SharedMemory(name=block_name(data_version))
+    deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+    while not shm.buf[0]:
+        if time.monotonic() > deadline:
+            shm.close()
+            raise TimeoutError(f"Shared benchmark panel {shm.name} was not published in time")
+        time.sleep(0.05)
+    return SharedBenchmarkPanel(shm, data_version)
+
+
+def _unlink_stale_blocks(data_version):
+    # Every earlier version's block, however many versions passed since this host last published
+    stale = set()
+    if _attached is not None and _attached.data_version != data_version:
+        stale.add(block_name(_attached.data_version))
+    prefix = block_name('')
+    if str(data_version).isdigit() and os.path.isdir(SHM_DIRECTORY):
+        for name in os.listdir(SHM_DIRECTORY):
+            version = name[len(prefix):]
+            if name.startswith(prefix) and version.isdigit() and int(version) < int(data_version):
+                stale.add(name)
+    for name in stale:
+        _unlink(name)
+
+
+def _unlink(name):
+    try:
+        stale = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    stale.close()
+    stale.unlink()
+
+
+def get_shared_panel(engine):
+    """
+    This process's view of the shared benchmark panel for the current data version.
+
+    Attaches to the host's block, or publishes it if this is the first process to see the
+    version. Returns None when the shared panel is disabled or cannot be loaded.
+    """
+    global _attached
+    if not shared_panel_enabled():
+        return None
+    data_version = get_benchmark_data_version()
+    panel = _attached
+    if panel is not None and (data_version is None or panel.data_version == data_version):
+        return panel
+    if data_version is None:
+        return None
+
+    with _lock:
+        if _attached is not None and _attached.data_version == data_version:
+            return _attached
+        try:
+            try:
+                panel = attach_panel(data_version)
+            except FileNotFoundError:
+                panel = publish_panel(data_version, engine)
+        except Exception as e:
+            logger.warning(f"Shared benchmark panel unavailable: {e}")
+            return None
+        # The previous version's block is closed once no task still holds its panel
+        _attached = panel
+    return panel
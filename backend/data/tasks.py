@@ -1,13 +1,50 @@
 # backend/data/tasks.py
 
 from celery import shared_task
+from celery.signals import worker_init, worker_process_init
 import asyncio
-from .benchmark_returns_collector import main as benchmark_main
+from .benchmark_returns_collector import main as benchmark_main, engine as benchmark_engine
+from .benchmark_snapshot import snapshot_directory, write_snapshot
+from .data_version import bump_benchmark_data_version
+from .shared_panel import shared_panel_enabled, get_shared_panel
+
+
+@worker_init.connect
+def preload_shared_benchmark_panel(**kwargs):
+    """
+    Load the benchmark panel into shared memory when a worker starts, before its pool
+    processes are created, so they attach to it instead of loading their own copy.
+    """
+    if shared_panel_enabled():
+        from analysis.data_processing import engine
+        get_shared_panel(engine)
+        # Pool processes must not inherit the connection the panel was loaded over
+        engine.dispose()
+
+@worker_process_init.connect
+def reset_inherited_connections(**kwargs):
+    """
+    Drop the database connections a forked pool process inherited from the worker parent
+    without closing them, so the parent's sockets are never shared; each process opens its own.
+    """
+    from analysis.data_processing import engine
+    engine.dispose(close=False)
+    benchmark_engine.dispose(close=False)
 
 @shared_task
-def run_benchmark_return_upload():
+def run_benchmark_return_upload(full_refresh=False):
     """
     Celery task to run the benchmark return upload script.
     Since `benchmark_main` is async, we run it using `asyncio.run()`.
+    Only months newer than those stored are fetched unless `full_refresh` is set.
+    Bumps the benchmark data version afterwards so worker caches reload, then refreshes this
+    host's snapshot for the new version and publishes the new shared benchmark panel.
     """
-    asyncio.run(benchmark_main())
+    asyncio.run(benchmark_main(full_refresh=full_refresh))
+    data_version = bump_benchmark_data_version()
+    # The local columnar copy read by the analysis workers; the database stays the source of truth
+    if snapshot_directory():
+        write_snapshot(benchmark_engine, snapshot_directory(), data_version)
+    if shared_panel_enabled():
+        from analysis.data_processing import engine
+        get_shared_panel(engine)
@@ -0,0 +1,80 @@
+# backend/result_cache.py
+
+import os
+import json
+import calendar
+import hashlib
+import logging
+from datetime import date
+from data.data_version import get_benchmark_data_version, redis_client
+
+logger = logging.getLogger(__name__)
+
+# Completed analyses are remembered for this long; keep it below Celery's result_expires
+# (one day by default) so a cached task ID always still has its result in the backend
+RESULT_CACHE_TTL_SECONDS = int(os.getenv('RESULT_CACHE_TTL_SECONDS', 12 * 60 * 60))
+RESULT_CACHE_PREFIX = 'analysis_result:'
+
+
+def normalize_request(data):
+    """
+    Canonical form of a /submit-data payload: row IDs dropped, fund returns parsed and sorted
+    by month, so payloads that describe the same analysis compare equal.
+    """
+    normalized = {key: value for key, value in data.items() if key != 'fund'}
+    fund = dict(data['fund'])
+    rows = [(month_end(row['date']), float(row['return'])) for row in fund.get('pastedData', [])]
+    fund['pastedData'] = sorted(rows)
+    normalized['fund'] = fund
+    return normalized
+
+
+def month_end(value):
+    """Month end of a pasted date, as YYYY-MM-DD."""
+    try:
+        day = date.fromisoformat(str(value).strip())
+    except ValueError:
+        # Other formats go through pandas, imported only when needed to keep it out of web startup
+        import pandas as pd
+        return (pd.to_datetime(value) + pd.offsets.MonthEnd(0)).strftime('%Y-%m-%d')
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1]).isoformat()
+
+
+def request_key(data, data_version=None):
+    """
+    Content hash of a request and the benchmark data version it would be computed against.
+
+    Returns None when the payload cannot be normalized or the data version is unavailable,
+    in which case the request is simply not cached.
+    """
+    data_version = data_version if data_version is not None else get_benchmark_data_version()
+    if data_version is None:
+        return None
+    try:
+        canonical = json.dumps([data_version, normalize_request(data)], sort_keys=True, separators=(',', ':'))
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Could not normalize request for the result cache: {e}")
+        return None
+    return RESULT_CACHE_PREFIX + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def lookup(key):
+    """ID of a completed task for this request key, or None."""
+    if key is None:
+        return None
+    try:
+        task_id = redis_client().get(key)
+    except Exception as e:
+        logger.warning(f"Result cache lookup failed: {e}")
+        return None
+    return task_id.decode() if task_id is not None else None
+
+
+def remember(key, task_id):
+    """Record that `task_id` holds the completed result for this request key."""
+    if key is None:
+        return
+    try:
+        redis_client().set(key, task_id, ex=RESULT_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Result cache store failed: {e}")
@@ -0,0 +1,99 @@
+# backend/result_encoding.py
+
+import json
+
+try:
+    import orjson
+except ImportError:  # Optional: the standard library encoder is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional: only needed for binary /task-status responses
+    msgpack = None
+
+# Celery serializer name for analysis results (see register_celery_serializer)
+CELERY_SERIALIZER = 'analysis_json'
+CELERY_CONTENT_TYPE = 'application/x-analysis-json'
+
+
+def _to_builtin(obj):
+    # Fallback for values the JSON encoders do not handle natively. NumPy is imported here and in
+    # pack_arrays rather than at module level, so the web process does not load it at startup.
+    import numpy as np
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_json(obj):
+    """
+    Encode an analysis result as compact JSON, in one pass.
+
+    Results are built from native structures that may hold NumPy arrays and scalars; orjson
+    serializes contiguous float arrays directly, without converting them to lists first.
+    With orjson, NaN and infinity are written as null.
+
+    Returns:
+    - payload (bytes): UTF-8 encoded JSON.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_to_builtin, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_to_builtin, separators=(',', ':')).encode('utf-8')
+
+
+def decode_json(payload):
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def register_celery_serializer():
+    """Make encode_json available to Celery as the CELERY_SERIALIZER serializer."""
+    from kombu.serialization import register
+    register(CELERY_SERIALIZER, encode_json, decode_json, content_type=CELERY_CONTENT_TYPE, content_encoding='utf-8')
+
+
+def pack_arrays(obj):
+    """
+    Replace numeric lists, and rectangular lists of numeric lists, with float32 array records.
+
+    Each array becomes {'__ndarray__': <little-endian float32 bytes>, 'dtype': 'float32', 'shape': [...]},
+    with missing values stored as NaN. Dictionary keys are converted to strings, as in the JSON results.
+    """
+    import numpy as np
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in 'iuf':
+        return {'__ndarray__': obj.astype('<f4').tobytes(), 'dtype': 'float32', 'shape': list(obj.shape)}
+    if isinstance(obj, dict):
+        return {str(key): pack_arrays(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        if obj and _is_numeric(obj):
+            try:
+                array = np.array(obj, dtype=float)
+            except ValueError:
+                # Ragged nested lists
+                return [pack_arrays(value) for value in obj]
+            return {'__ndarray__': array.astype('<f4').tobytes(), 'dtype': 'float32', 'shape': list(array.shape)}
+        return [pack_arrays(value) for value in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _is_numeric(values):
+    if all(isinstance(value, list) for value in values):
+        return all(value and _is_numeric(value) for value in values)
+    return all(value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)) for value in values)
+
+
+def encode_msgpack(obj):
+    """
+    Compact binary encoding of an analysis result: msgpack with float32 arrays.
+    """
+    if msgpack is None:
+        raise ValueError("msgpack encoding requires the msgpack package")
+    return msgpack.packb(pack_arrays(obj), use_bin_type=True)
@@ -0,0 +1,114 @@
+# backend/task_metrics.py
+
+import json
+import logging
+from collections import defaultdict
+from data.data_version import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Counters and histograms of the analysis tasks. Workers add to one Redis hash, so the figures
+# cover every worker process, and /metrics renders it in the Prometheus text format. Each hash
+# field is a JSON [series name, sorted label pairs].
+TASK_METRICS_KEY = 'task_metrics'
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+METRICS = {
+    'analysis_tasks_total': ('counter', "Analysis tasks finished, by task and status."),
+    'analysis_task_seconds': ('histogram', "Wall time of analysis tasks."),
+    'analysis_stage_seconds': ('histogram', "Wall time of analysis task stages."),
+    'analysis_stage_rows_total': ('counter', "Monthly rows processed by analysis task stages."),
+}
+_HISTOGRAM_SUFFIXES = ['_bucket', '_sum', '_count']
+
+
+def _field(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+def _observe(increments, name, labels, seconds):
+    for bound in SECONDS_BUCKETS:
+        if seconds <= bound:
+            increments[_field(f"{name}_bucket", {**labels, 'le': str(bound)})] += 1
+    increments[_field(f"{name}_bucket", {**labels, 'le': '+Inf'})] += 1
+    increments[_field(f"{name}_sum", labels)] += seconds
+    increments[_field(f"{name}_count", labels)] += 1
+
+
+def record_task(task_name, spans, seconds, status):
+    """
+    Add a finished task and the timing spans of its stages to the metrics.
+
+    Parameters:
+    - task_name (str): Task label, e.g. 'process_data'.
+    - spans (list[dict]): Spans with 'stage' and 'seconds', and optionally 'model' and 'rows'.
+    - seconds (float): Wall time of the whole task.
+    - status (str): 'success', 'failure' or 'replaced' (split into a chord).
+    """
+    increments = defaultdict(float)
+    increments[_field('analysis_tasks_total', {'task': task_name, 'status': status})] += 1
+    _observe(increments, 'analysis_task_seconds', {'task': task_name}, seconds)
+    for span in spans:
+        labels = {'task': task_name, 'stage': span['stage']}
+        if 'model' in span:
+            labels['model'] = span['model']
+        _observe(increments, 'analysis_stage_seconds', labels, span['seconds'])
+        if span.get('rows'):
+            increments[_field('analysis_stage_rows_total', labels)] += span['rows']
+
+    try:
+        pipeline = redis_client().pipeline(transaction=False)
+        for field, amount in increments.items():
+            pipeline.hincrbyfloat(TASK_METRICS_KEY, field, amount)
+        pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Could not record task metrics: {e}")
+
+
+def render_metrics():
+    """
+    Every recorded metric in the Prometheus text exposition format.
+
+    Raises the Redis client's error when the metrics cannot be read.
+    """
+    series = defaultdict(list)
+    for field, value in redis_client().hgetall(TASK_METRICS_KEY).items():
+        name, labels = json.loads(field)
+        labels = dict(labels)
+        metric = next(
+            (name[:-len(suffix)] for suffix in _HISTOGRAM_SUFFIXES
+             if name.endswith(suffix) and METRICS.get(name[:-len(suffix)], ('',))[0] == 'histogram'),
+            name
+        )
+        series[metric].append((name, labels, float(value)))
+
+    lines = []
+    for metric, (metric_type, description) in METRICS.items():
+        if metric not in series:
+            continue
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for name, labels, value in sorted(series[metric], key=_series_order):
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def _series_order(entry):
+    # Series of the same labels together, buckets in ascending order, then _sum and _count
+    name, labels, _ = entry
+    suffix = next((i for i, suffix in enumerate(_HISTOGRAM_SUFFIXES) if name.endswith(suffix)), 0)
+    le = labels.get('le')
+    return (sorted((key, value) for key, value in labels.items() if key != 'le'), suffix, float(le) if le else 0.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = {key: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for key, value in labels.items()}
+    # le goes last, as Prometheus clients write it
+    keys = sorted(escaped, key=lambda key: (key == 'le', key))
+    return '{' + ','.join(f'{key}="{escaped[key]}"' for key in keys) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if value.is_integer() else repr(value)
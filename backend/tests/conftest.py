@@ -0,0 +1,35 @@
+# backend/tests/conftest.py
+
+import os
+import sys
+import tempfile
+import pytest
+
+# The analysis modules import each other as top-level packages of backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+from benchmarks.analysis_benchmarks import MemoryRedis, configure_environment
+
+# A SQLite database of the synthetic factors stands in for the benchmark database. The analysis
+# modules read its URL when first imported, so it is configured before any test module loads.
+N_MONTHS = 240
+N_FACTORS = 4
+FUND_RETURNS, FACTOR_RETURNS = synthetic.make_returns(N_MONTHS, N_FACTORS)
+_database_dir = tempfile.TemporaryDirectory()
+configure_environment(synthetic.write_sqlite(os.path.join(_database_dir.name, 'benchmarks.db'), FACTOR_RETURNS))
+
+
+@pytest.fixture
+def factor_returns():
+    # The factor returns stored in the benchmark database
+    return FACTOR_RETURNS
+
+
+@pytest.fixture
+def redis():
+    # In-memory Redis behind the Celery backend, fresh for each test
+    from celery_app import celery
+    client = MemoryRedis()
+    celery.backend.client = client
+    return client
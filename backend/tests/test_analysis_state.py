@@ -0,0 +1,75 @@
+# backend/tests/test_analysis_state.py
+
+import pytest
+import result_encoding
+from analysis import analysis_state, data_processing, tasks
+from benchmarks import synthetic
+from conftest import N_FACTORS
+from test_batch import assert_results_close
+
+MONTHS = 96
+
+
+def request(months, seed=1, residualized=False):
+    fund, _ = synthetic.make_returns(MONTHS, N_FACTORS, seed)
+    data = synthetic.make_request(fund.iloc[:months], N_FACTORS)
+    if not residualized:
+        for stream in data['residual_return_streams']:
+            stream['residualization'] = []
+    return data
+
+
+def analyze(data):
+    return result_encoding.decode_json(result_encoding.encode_json(tasks.process_data.apply(args=[data]).get()))
+
+
+def stored_states(data):
+    # What process_data would resume from for this request
+    fund_return_df, _, active_return_df, regression_df = data_processing.create_return_dfs(data)
+    inputs = {
+        'Absolute': analysis_state.input_arrays(fund_return_df, regression_df),
+        'Active': analysis_state.input_arrays(active_return_df, regression_df)
+    }
+    return analysis_state.load_state(analysis_state.state_key(data), inputs)
+
+
+@pytest.fixture
+def state_enabled(monkeypatch, redis):
+    monkeypatch.setattr(analysis_state, 'ANALYSIS_STATE_TTL_SECONDS', 3600)
+    return redis
+
+
+def test_resumed_analysis_matches_a_fresh_one(state_enabled, monkeypatch):
+    analyze(request(MONTHS - 1))
+    states, keep = stored_states(request(MONTHS))
+    assert keep
+    for time_frame in tasks.TIME_FRAMES:
+        models = states['Absolute'][time_frame]
+        assert sorted(models) == sorted(tasks.MODEL_TYPES)
+        assert all(len(models[model_type]['window_stats']) == MONTHS - time_frame for model_type in tasks.MODEL_TYPES)
+        assert 'warm_start' in models['Lasso']
+    resumed = analyze(request(MONTHS))
+
+    monkeypatch.setattr(analysis_state, 'ANALYSIS_STATE_TTL_SECONDS', 0)
+    assert_results_close(resumed, analyze(request(MONTHS)))
+
+
+def test_revised_month_limits_the_reused_windows(state_enabled):
+    analyze(request(MONTHS - 1))
+    revised = request(MONTHS)
+    revised['fund']['pastedData'][40]['return'] = '0.05'
+    states, keep = stored_states(revised)
+    assert keep
+    assert 60 not in states['Absolute']
+    for time_frame in [12, 36]:
+        for model_type, state in states['Absolute'][time_frame].items():
+            assert len(state['window_stats']) == 40 - time_frame + 1
+            assert 'warm_start' not in state
+
+
+def test_residualized_factors_are_not_kept(state_enabled):
+    data = request(MONTHS, residualized=True)
+    assert analysis_state.state_key(data) is None
+    assert stored_states(data) == ({}, False)
+    analyze(data)
+    assert not any(key.startswith(analysis_state.ANALYSIS_STATE_PREFIX) for key in state_enabled.values)
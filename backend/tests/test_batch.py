@@ -0,0 +1,76 @@
+# backend/tests/test_batch.py
+
+import numpy as np
+import pytest
+import result_encoding
+from analysis import data_processing, tasks
+from benchmarks import synthetic
+from conftest import N_FACTORS
+
+
+def fund_json(description, months, seed):
+    fund, _ = synthetic.make_returns(months, N_FACTORS, seed)
+    return synthetic.make_request(fund, N_FACTORS)['fund'] | {'description': description}
+
+
+def batch_request(funds):
+    request = synthetic.make_request(synthetic.make_returns(1, N_FACTORS)[0], N_FACTORS)
+    del request['fund']
+    return request | {'funds': funds}
+
+
+def assert_results_close(actual, expected, path='results'):
+    # Compares results as they are sent to the client, allowing for floating-point reordering
+    assert type(actual) is type(expected), path
+    if isinstance(expected, dict):
+        assert list(actual) == list(expected), path
+        for key in expected:
+            assert_results_close(actual[key], expected[key], f"{path}[{key!r}]")
+    elif isinstance(expected, list):
+        assert len(actual) == len(expected), path
+        for i, (a, e) in enumerate(zip(actual, expected)):
+            assert_results_close(a, e, f"{path}[{i}]")
+    elif isinstance(expected, float):
+        np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-12, err_msg=path)
+    else:
+        assert actual == expected, path
+
+
+def test_batch_matches_single_fund_analyses(redis):
+    funds = [fund_json('Fund A', 96, 1), fund_json('Fund B', 96, 2), fund_json('Fund C', 84, 3)]
+    request = batch_request(funds)
+    batch = tasks.process_batch.apply(args=[request]).get()
+
+    assert list(batch['funds']) == ['Fund A', 'Fund B', 'Fund C']
+    for fund in funds:
+        single = tasks.process_data.apply(args=[request | {'fund': fund}]).get()
+        assert_results_close(
+            result_encoding.decode_json(result_encoding.encode_json(batch['funds'][fund['description']])),
+            result_encoding.decode_json(result_encoding.encode_json(single))
+        )
+
+
+def test_timings_are_kept_apart_from_funds(redis):
+    request = batch_request([fund_json('timings', 72, 1)]) | {'options': {'timings': True}}
+    batch = tasks.process_batch.apply(args=[request]).get()
+
+    assert list(batch) == ['funds', 'timings']
+    assert list(batch['funds']) == ['timings']
+    assert 'Absolute' in batch['funds']['timings']
+
+
+def test_funds_are_grouped_by_months():
+    funds = [fund_json('Fund A', 96, 1), fund_json('Fund B', 84, 2), fund_json('Fund C', 96, 3)]
+    groups = data_processing.create_batch_return_dfs(batch_request(funds))
+
+    assert [list(fund_return_df.columns) for fund_return_df, _, _ in groups] == [['Fund A', 'Fund C'], ['Fund B']]
+    for fund_return_df, active_return_df, regression_df in groups:
+        assert list(active_return_df.columns) == list(fund_return_df.columns)
+        assert regression_df.index.equals(fund_return_df.index)
+    assert len(groups[0][0]) == 96 and len(groups[1][0]) == 84
+
+
+def test_duplicate_fund():
+    funds = [fund_json('Fund A', 96, 1), fund_json('Fund A', 84, 2)]
+    with pytest.raises(Exception, match="Duplicate fund: Fund A"):
+        data_processing.create_batch_return_dfs(batch_request(funds))
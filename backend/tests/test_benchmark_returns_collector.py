@@ -0,0 +1,159 @@
+# backend/tests/test_benchmark_returns_collector.py
+
+import time
+import asyncio
+import aiohttp
+import pytest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from data import benchmark_returns_collector as collector
+
+
+class FakeAPI:
+    """
+    Token endpoint and one data endpoint of the API; tokens are accepted until revoked, and the
+    first `throttled` data requests are answered 429 with the given Retry-After.
+    """
+
+    def __init__(self, expires_in=3600, throttled=0, retry_after=None):
+        self.expires_in = expires_in
+        self.tokens_issued = 0
+        self.revoked = set()
+        self.throttled = throttled
+        self.retry_after = retry_after
+        self.app = web.Application()
+        self.app.router.add_post('/connect/token', self.token)
+        self.app.router.add_get('/returns', self.returns)
+
+    async def token(self, request):
+        self.tokens_issued += 1
+        return web.json_response({'access_token': f"token-{self.tokens_issued}", 'expires_in': self.expires_in})
+
+    async def returns(self, request):
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if token in self.revoked or not token.startswith('token-'):
+            return web.json_response({'error': 'invalid_token'}, status=401)
+        if self.throttled:
+            self.throttled -= 1
+            return web.json_response({'error': 'rate_limited'}, status=429, headers={'Retry-After': self.retry_after})
+        return web.json_response({'results': [{'token': token}]})
+
+
+def run_against(api, test, monkeypatch, rate_limiter=None):
+    # Runs `test(client, server)` with TOKEN_URL pointed at the fake API
+    async def main():
+        server = TestServer(api.app)
+        await server.start_server()
+        monkeypatch.setattr(collector, 'TOKEN_URL', str(server.make_url('/connect/token')))
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await test(collector.APIAsyncClient(session, rate_limiter), server)
+        finally:
+            await server.close()
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_one_token(monkeypatch):
+    api = FakeAPI()
+
+    async def test(client, server):
+        return await asyncio.gather(*[client._valid_token() for _ in range(10)])
+
+    assert run_against(api, test, monkeypatch) == ['token-1'] * 10
+    assert api.tokens_issued == 1
+
+
+def test_token_is_refreshed_before_it_expires(monkeypatch):
+    monkeypatch.setattr(collector, 'TOKEN_REFRESH_MARGIN_SECONDS', 0.5)
+    api = FakeAPI(expires_in=0.8)
+
+    async def test(client, server):
+        tokens = [await client._valid_token(), await client._valid_token()]
+        await asyncio.sleep(0.4)
+        tokens.append(await client._valid_token())
+        return tokens
+
+    assert run_against(api, test, monkeypatch) == ['token-1', 'token-1', 'token-2']
+    assert api.tokens_issued == 2
+
+
+def test_concurrent_rejections_refresh_once(monkeypatch):
+    api = FakeAPI()
+
+    async def test(client, server):
+        assert await client._valid_token() == 'token-1'
+        api.revoked.add('token-1')
+        url = str(server.make_url('/returns'))
+        return await asyncio.gather(*[client._fetch_page(url) for _ in range(10)])
+
+    pages = run_against(api, test, monkeypatch)
+    assert pages == [{'results': [{'token': 'token-2'}]}] * 10
+    assert api.tokens_issued == 2
+
+
+def test_throttled_request_waits_for_retry_after(monkeypatch):
+    api = FakeAPI(throttled=1, retry_after='0.3')
+    limiter = collector.AdaptiveRateLimiter(max_concurrency=8)
+
+    async def test(client, server):
+        start = time.perf_counter()
+        page = await client._fetch_page(str(server.make_url('/returns')))
+        return page, time.perf_counter() - start
+
+    page, elapsed = run_against(api, test, monkeypatch, limiter)
+    assert page == {'results': [{'token': 'token-1'}]}
+    assert elapsed >= 0.3
+    # Halved by the 429, then raised by the success
+    assert limiter.limit == 4 + 1 / 4
+
+
+def test_throttling_halves_the_limit_once_per_pause():
+    async def main():
+        limiter = collector.AdaptiveRateLimiter(max_concurrency=8)
+        limiter.throttled(0.2)
+        limiter.throttled(0.2)
+        assert limiter.limit == 4
+
+        start = asyncio.get_running_loop().time()
+        async with limiter:
+            waited = asyncio.get_running_loop().time() - start
+        assert waited >= 0.2 - 1e-3
+
+        limiter.throttled(0.0)
+        assert limiter.limit == 2
+        for _ in range(10):
+            limiter.throttled(0.0)
+        assert limiter.limit == limiter.min_concurrency
+
+    asyncio.run(main())
+
+
+def test_limit_recovers_to_the_maximum():
+    limiter = collector.AdaptiveRateLimiter(max_concurrency=4)
+    limiter.limit = 2.0
+    for _ in range(20):
+        limiter.succeeded()
+    assert limiter.limit == 4
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('120', 120.0),
+    ('0.5', 0.5),
+    ('-5', 0.0),
+    (None, None),
+    ('', None),
+    ('soon', None),
+    ('nan', None),
+    ('inf', None),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert collector.parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 28 <= collector.parse_retry_after(later) <= 30
+    earlier = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=30), usegmt=True)
+    assert collector.parse_retry_after(earlier) == 0.0
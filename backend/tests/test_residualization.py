@@ -0,0 +1,70 @@
+# backend/tests/test_residualization.py
+
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+from analysis import data_processing
+
+
+def stream(description, residualization=(), source=None):
+    return {'source': source or description, 'description': description, 'residualization': list(residualization)}
+
+
+def level_descriptions(plan):
+    return [[regression_json['description'] for regression_json in level] for level in plan.levels]
+
+
+def test_deep_chain_declared_out_of_order():
+    streams = [stream('D', ['C']), stream('B', ['A']), stream('C', ['B', 'A']), stream('A')]
+    plan = data_processing.plan_residualization(streams)
+
+    assert level_descriptions(plan) == [['A'], ['B'], ['C'], ['D']]
+    assert plan.columns == ['D', 'B', 'C', 'A']
+
+
+def test_independent_factors_share_a_level():
+    streams = [stream('Value', ['Market']), stream('Market'), stream('Size', ['Market']), stream('Rates')]
+    plan = data_processing.plan_residualization(streams)
+
+    assert level_descriptions(plan) == [['Market', 'Rates'], ['Value', 'Size']]
+
+
+@pytest.mark.parametrize('streams', [
+    [stream('A', ['B']), stream('B', ['A'])],
+    [stream('A', ['A']), stream('B')],
+], ids=['two-cycle', 'self-cycle'])
+def test_cycle(streams):
+    with pytest.raises(Exception, match="form a cycle between: \\['A'"):
+        data_processing.plan_residualization(streams)
+
+
+def test_missing_dependency():
+    with pytest.raises(Exception, match="Residualization of B depends on factors that were not provided: \\['C'\\]"):
+        data_processing.plan_residualization([stream('A'), stream('B', ['A', 'C'])])
+
+
+def test_duplicate_description():
+    with pytest.raises(Exception, match="Duplicate regression factor: A"):
+        data_processing.plan_residualization([stream('A', source='Factor 1'), stream('A', source='Factor 2')])
+
+
+def test_perform_residualization_keeps_submission_order(factor_returns):
+    streams = [
+        stream('Third', ['Second'], source='Factor 3'),
+        stream('First', source='Factor 1'),
+        stream('Second', ['First'], source='Factor 2'),
+        stream('Fourth', ['First'], source='Factor 4'),
+    ]
+    fund_return_df = pd.DataFrame(index=factor_returns.index[-120:])
+    plan = data_processing.plan_residualization(streams)
+    regression_df = data_processing.create_initial_regression_df(fund_return_df, plan, factor_returns)
+    regression_df = data_processing.perform_residualization(regression_df, plan, factor_returns)
+
+    assert list(regression_df.columns) == ['Third', 'First', 'Second', 'Fourth']
+    factors = factor_returns.loc[fund_return_df.index]
+    second = sm.OLS(factors['Factor 2'], sm.add_constant(factors['Factor 1'])).fit().resid
+    third = sm.OLS(factors['Factor 3'], sm.add_constant(second.rename('Second'))).fit().resid
+    np.testing.assert_allclose(regression_df['First'], factors['Factor 1'])
+    np.testing.assert_allclose(regression_df['Second'], second, atol=1e-14)
+    np.testing.assert_allclose(regression_df['Third'], third, atol=1e-14)
@@ -0,0 +1,71 @@
+# backend/tests/test_rolling_lasso.py
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LassoCV
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.preprocessing import StandardScaler
+from analysis import rolling_lasso
+from analysis.model import LASSO_ALPHAS, CV_SPLITS
+
+
+def make_data(n=120, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 0.04, (n, 5))
+    y = X @ np.array([0.8, 0.3, 0.0, 0.0, -0.2]) + rng.normal(0, 0.02, n)
+    return X, y
+
+
+def lasso_cv(X, y, tol):
+    # The per-window fit of model.fit_model_and_get_stats, solved cyclically to `tol`
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    model = LassoCV(alphas=LASSO_ALPHAS, cv=TimeSeriesSplit(n_splits=CV_SPLITS), fit_intercept=False, tol=tol, max_iter=100000)
+    model.fit(X_scaled, y)
+    return model.coef_ / scaler.scale_, model.alpha_, model.score(X_scaled, y)
+
+
+# Below 36 months the training folds are too short for the Lasso solution to be unique, and the
+# warm start can settle on a different alpha than a cold LassoCV fit
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('window', [36, 60])
+def test_matches_exact_lasso_cv(window, seed):
+    X, y = make_data(seed=seed)
+    results = rolling_lasso.rolling_lasso(X, y, window, LASSO_ALPHAS, TimeSeriesSplit(n_splits=CV_SPLITS), max_iter=100000, tol=1e-10)
+
+    for w in range(len(y) - window + 1):
+        coefficients, best_alpha, score = lasso_cv(X[w:w + window], y[w:w + window], tol=1e-10)
+        assert results['best_alpha'][w] == best_alpha
+        np.testing.assert_allclose(results['coefficients'][w], coefficients, atol=1e-8)
+        np.testing.assert_allclose(results['score'][w], score, atol=1e-8)
+
+
+@pytest.mark.parametrize('window', [36, 60])
+def test_default_tolerance_selects_the_same_alphas(window):
+    X, y = make_data(seed=1)
+    results = rolling_lasso.rolling_lasso(X, y, window, LASSO_ALPHAS, TimeSeriesSplit(n_splits=CV_SPLITS))
+
+    for w in range(len(y) - window + 1):
+        coefficients, best_alpha, score = lasso_cv(X[w:w + window], y[w:w + window], tol=1e-10)
+        assert results['best_alpha'][w] == best_alpha
+        # Coefficients only agree to the error left at the default duality gap tolerance (1e-4)
+        np.testing.assert_allclose(results['coefficients'][w], coefficients, atol=1e-2)
+        np.testing.assert_allclose(results['score'][w], score, atol=1e-2)
+
+
+def test_warm_start_continues_the_solution_path():
+    X, y = make_data()
+    cv = TimeSeriesSplit(n_splits=CV_SPLITS)
+    whole = rolling_lasso.rolling_lasso(X, y, 36, LASSO_ALPHAS, cv)
+    first = rolling_lasso.rolling_lasso(X[:60], y[:60], 36, LASSO_ALPHAS, cv)
+    rest = rolling_lasso.rolling_lasso(X[25:], y[25:], 36, LASSO_ALPHAS, cv, warm_start=first['warm_start'])
+
+    np.testing.assert_array_equal(np.concatenate([first['best_alpha'], rest['best_alpha']]), whole['best_alpha'])
+    np.testing.assert_allclose(np.concatenate([first['coefficients'], rest['coefficients']]), whole['coefficients'], atol=1e-12)
+
+
+def test_rejects_missing_values():
+    X, y = make_data()
+    y[10] = np.nan
+    with pytest.raises(ValueError):
+        rolling_lasso.rolling_lasso(X, y, 36, LASSO_ALPHAS, TimeSeriesSplit(n_splits=CV_SPLITS))
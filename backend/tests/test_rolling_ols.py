@@ -0,0 +1,53 @@
+# backend/tests/test_rolling_ols.py
+
+import numpy as np
+import pytest
+import statsmodels.api as sm
+from analysis import rolling_ols
+
+STATISTICS = {
+    'coefficients': 'params',
+    'r_squared': 'rsquared',
+    'adj_r_squared': 'rsquared_adj',
+    'p_values': 'pvalues',
+    'f_statistic': 'fvalue',
+    'aic': 'aic',
+    'bic': 'bic',
+}
+
+
+def make_data(n=90, k=4, m=1, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 0.04, (n, k))
+    beta = rng.normal(0.5, 0.3, (k, m))
+    Y = X @ beta + rng.normal(0, 0.02, (n, m))
+    return X, Y[:, 0] if m == 1 else Y
+
+
+@pytest.mark.parametrize('window', [12, 36])
+def test_matches_statsmodels_ols(window):
+    X, y = make_data()
+    results = rolling_ols.rolling_ols(X, y, window)
+
+    assert len(results['coefficients']) == len(y) - window + 1
+    for w in range(len(y) - window + 1):
+        expected = sm.OLS(y[w:w + window], X[w:w + window]).fit()
+        for name, attribute in STATISTICS.items():
+            np.testing.assert_allclose(results[name][w], getattr(expected, attribute), rtol=1e-8, err_msg=name)
+
+
+def test_several_responses_match_single_fits():
+    X, Y = make_data(m=3)
+    together = rolling_ols.rolling_ols(X, Y, 24)
+
+    for j in range(Y.shape[1]):
+        alone = rolling_ols.rolling_ols(X, Y[:, j], 24)
+        for name in STATISTICS:
+            np.testing.assert_allclose(together[name][:, j], alone[name], rtol=1e-10, err_msg=name)
+
+
+def test_history_shorter_than_window():
+    X, y = make_data(n=10)
+    results = rolling_ols.rolling_ols(X, y, 12)
+    assert results['coefficients'].shape == (0, X.shape[1])
+    assert results['r_squared'].shape == (0,)
@@ -0,0 +1,43 @@
+# backend/tests/test_rolling_ridge.py
+
+import numpy as np
+import pytest
+from sklearn.linear_model import RidgeCV
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.preprocessing import StandardScaler
+from analysis import rolling_ridge
+from analysis.model import RIDGE_ALPHAS, CV_SPLITS
+from test_rolling_ols import make_data
+
+
+def ridge_cv(X, y):
+    # The per-window fit of model.fit_model_and_get_stats
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    model = RidgeCV(alphas=RIDGE_ALPHAS, fit_intercept=False, cv=TimeSeriesSplit(n_splits=CV_SPLITS), scoring='r2')
+    model.fit(X_scaled, y)
+    return model.coef_ / scaler.scale_, model.alpha_, model.score(X_scaled, y)
+
+
+@pytest.mark.parametrize('window', [12, 36, 60])
+def test_matches_ridge_cv(window):
+    X, y = make_data(n=100)
+    results = rolling_ridge.rolling_ridge(X, y, window, RIDGE_ALPHAS, TimeSeriesSplit(n_splits=CV_SPLITS))
+
+    for w in range(len(y) - window + 1):
+        coefficients, best_alpha, score = ridge_cv(X[w:w + window], y[w:w + window])
+        assert results['best_alpha'][w] == best_alpha
+        np.testing.assert_allclose(results['coefficients'][w], coefficients, rtol=1e-8, atol=1e-12)
+        np.testing.assert_allclose(results['score'][w], score, rtol=1e-8, atol=1e-12)
+
+
+def test_several_responses_select_their_own_alpha():
+    X, Y = make_data(n=80, m=5, seed=1)
+    # Chunks smaller than the number of responses exercise the chunked scoring
+    together = rolling_ridge.rolling_ridge(X, Y, 36, RIDGE_ALPHAS, TimeSeriesSplit(n_splits=CV_SPLITS), chunk_size=2)
+
+    for j in range(Y.shape[1]):
+        alone = rolling_ridge.rolling_ridge(X, Y[:, j], 36, RIDGE_ALPHAS, TimeSeriesSplit(n_splits=CV_SPLITS))
+        np.testing.assert_array_equal(together['best_alpha'][:, j], alone['best_alpha'])
+        np.testing.assert_allclose(together['coefficients'][:, j], alone['coefficients'], rtol=1e-10, atol=1e-14)
+        np.testing.assert_allclose(together['score'][:, j], alone['score'], rtol=1e-10, atol=1e-14)
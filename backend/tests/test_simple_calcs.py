@@ -0,0 +1,43 @@
+# backend/tests/test_simple_calcs.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from analysis import simple_calcs
+
+
+def compounded(returns, window, periods_per_year=12):
+    # Direct definition: compound each window, then annualize
+    growth = (1 + returns).rolling(window, min_periods=window).apply(np.prod, raw=True)
+    return growth ** (periods_per_year / window) - 1
+
+
+@pytest.mark.parametrize('window', [1, 12, 36])
+def test_matches_compounded_windows(window):
+    rng = np.random.default_rng(0)
+    returns = pd.Series(rng.normal(0.007, 0.045, 120), index=pd.date_range('2010-01-31', periods=120, freq='ME'), name='Fund')
+
+    result = simple_calcs.annualized_rolling_return(returns, window)
+
+    pd.testing.assert_series_equal(result, compounded(returns, window), rtol=1e-12)
+
+
+def test_missing_and_wiped_out_months():
+    rng = np.random.default_rng(1)
+    values = rng.normal(0.007, 0.045, 60)
+    values[[5, 40]] = np.nan
+    values[20] = -1.0
+    returns = pd.Series(values, index=pd.date_range('2015-01-31', periods=60, freq='ME'), name='Fund')
+
+    result = simple_calcs.annualized_rolling_return(returns, 12)
+    expected = compounded(returns, 12)
+
+    pd.testing.assert_series_equal(result, expected, rtol=1e-12)
+    # Windows holding a missing month are NaN, those holding a -100% month lose everything
+    assert result.iloc[5:17].isna().all()
+    assert (result.iloc[20:32] == -1.0).all()
+
+
+def test_history_shorter_than_window():
+    returns = pd.Series([0.01, 0.02], index=pd.date_range('2020-01-31', periods=2, freq='ME'))
+    assert simple_calcs.annualized_rolling_return(returns, 12).isna().all()